@@ -0,0 +1,39 @@
+"""Align the scores of all variants over the global instance ids
+
+An instance is kept only if every variant has a score for it (Perspective API may fail on
+single instances of any variant). The alignment is a boolean validity mask over the global
+instance ids, the same mask selects the gold labels of the kept instances
+
+Usage:
+    from alignScores import load_aligned_scores
+    aligned, valid = load_aligned_scores()
+    aligned["aave"]  # scores of the kept instances, in instance order
+    gold_labels[valid]  # gold labels of the same instances
+"""
+
+import numpy as np
+
+from scoreFiles import SCORES_DIR, VARIANTS, DEFAULT_ATTRIBUTE
+from scoreStore import load_scores
+
+
+def validity_mask(scores):
+    """True for the instances scored in every variant
+    Input: variants x instances matrix with NaN for failed instances"""
+    return ~np.isnan(scores).any(axis=0)
+
+
+def load_aligned_scores(
+    scores_dir=SCORES_DIR, attribute=DEFAULT_ATTRIBUTE, variants=VARIANTS
+):
+    """Load the scores of all variants and drop the instances that failed in any variant
+    Return: tuple ({variant: array of the kept scores}, validity mask over all instances)
+    """
+    scores, meta = load_scores(scores_dir, attribute, variants)
+    valid = validity_mask(scores)
+
+    aligned = {
+        variant: scores[meta["variants"].index(variant)][valid] for variant in variants
+    }
+
+    return aligned, valid
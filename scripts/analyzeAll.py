@@ -0,0 +1,227 @@
+"""Run the reliability, significance and toxicity cap analyses in one pass
+
+checkPerspectiveReliability.py, testScoreSignificance.py and evaluateToxicityCap.py each load
+the gold labels and the scores of all variants, align them and split them by gold label
+This script does that once and runs the analyses as stages over the shared arrays; every
+stage prints what its script prints and returns its results for a consolidated report
+
+Prequisites:
+    - the original HateXplain dataset in json format (or its gold-label index)
+    - scores of the original and all 4 dialects (score store or batch files)
+
+Usage:
+    $ python analyzeAll.py [reliability sweep significance cap rules] [--attribute TOXICITY]
+        [--scores-dir ../scores] [--gold-rule fewer_than_2_normal]
+    runs the given analyses (default: all)
+
+Outputs:
+    - To ./outputs: analysis-report.json with the results of all analyses run
+    - To ./outputs: the threshold sweep of checkPerspectiveReliability.py --sweep (sweep)
+    - To ./outputs: the plots of evaluateToxicityCap.py (cap)
+    (rules: the rule attribution of ruleAttribution.py is part of the report)
+    (other attributes, scores directories or gold rules get their name as file name suffix)
+"""
+
+import json
+import time
+import argparse
+
+from alignScores import load_aligned_scores
+from goldLabels import load_gold_index, rule_suffix, DEFAULT_RULE, RULES
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR
+from checkPerspectiveReliability import (
+    print_results,
+    check_perspective_credibility,
+    sweep_credibility,
+)
+from testScoreSignificance import test_score_significance, test_resampling_significance
+from ruleAttribution import attribute_all_dialects
+from evaluateToxicityCap import (
+    print_tox_increase_count,
+    save_all_score_plots,
+    save_all_change_plots,
+    save_inc_dec_percentages_plot,
+)
+
+# variant in the score store: name in printouts, plots and reports
+DIALECT_NAMES = {
+    "aave": "AAVE",
+    "nigerianD": "NigerianD",
+    "indianD": "IndianD",
+    "singlish": "Singlish",
+}
+
+
+def load_analysis_data(
+    scores_dir=SCORES_DIR, attribute=DEFAULT_ATTRIBUTE, gold_rule=DEFAULT_RULE
+):
+    """Load, align and split the scores of all variants once
+    Return: dict with the aligned scores, validity mask, gold labels of the kept instances,
+    gold splits {variant: (toxic scores, non-toxic scores)} and the output file suffix
+    """
+    gold = load_gold_index()
+    aligned, valid = load_aligned_scores(scores_dir, attribute)
+
+    return {
+        "aligned": aligned,
+        "valid": valid,
+        "gold_labels": gold.labels(gold_rule)[valid],
+        "splits": {
+            variant: gold.split(scores, valid, gold_rule)
+            for variant, scores in aligned.items()
+        },
+        "suffix": output_suffix(attribute, scores_dir) + rule_suffix(gold_rule),
+    }
+
+
+def run_reliability(data):
+    """Toxic counts of all variants and Chi-square test of gold vs. Perspective labels"""
+    aligned = data["aligned"]
+    counts = print_results(
+        aligned["original"].tolist(),
+        *[aligned[variant].tolist() for variant in DIALECT_NAMES],
+    )
+    credibility = check_perspective_credibility(
+        data["gold_labels"], aligned["original"].tolist()
+    )
+
+    return {"toxic_counts": counts, "credibility": credibility}
+
+
+def run_significance(data):
+    """Paired t-tests and resampling tests of original vs. each dialect, per gold label"""
+    og_splits = data["splits"]["original"]
+    results = {}
+    for i, (variant, name) in enumerate(DIALECT_NAMES.items()):
+        if i:
+            print("-" * 50)
+        print(f"Original vs. {name}")
+        results[f"Original vs. {name}"] = test_score_significance(
+            og_splits, data["splits"][variant]
+        )
+    print("-" * 50)
+    test_resampling_significance(
+        og_splits,
+        {name: data["splits"][variant] for variant, name in DIALECT_NAMES.items()},
+        results,
+    )
+
+    return results
+
+
+def run_cap(data):
+    """Share of instances whose score increases in each dialect, and the plots"""
+    splits = data["splits"]
+    suffix = data["suffix"]
+    increases = {
+        name: print_tox_increase_count(splits["original"], splits[variant], name)
+        for variant, name in DIALECT_NAMES.items()
+    }
+
+    print("\nSaving all scores plot ...", end="", flush=True)
+    save_all_score_plots(
+        splits["original"], *[splits[variant] for variant in DIALECT_NAMES], suffix
+    )
+    print(" done!")
+
+    print("Saving OG scores vs. dialect scores comparison plots ...")
+    save_all_change_plots(
+        splits["original"],
+        {name: splits[variant] for variant, name in DIALECT_NAMES.items()},
+        suffix,
+    )
+
+    print(
+        "Saving percentages of instances with toxicity score increase plot ...",
+        end="",
+        flush=True,
+    )
+    save_inc_dec_percentages_plot(
+        [p * 100 for incp in increases.values() for p in incp], suffix
+    )
+    print(" done!")
+
+    return {
+        name: {"gntox_increase": gntox_incp, "gtox_increase": gtox_incp}
+        for name, (gntox_incp, gtox_incp) in increases.items()
+    }
+
+
+def run_sweep(data):
+    """ROC/PR curves and Chi-square of gold vs. Perspective labels at every threshold"""
+    return sweep_credibility(data["gold_labels"], data["aligned"], data["suffix"])
+
+
+def run_rules(data):
+    """Score change statistics and regression coefficients of the applied dialect rules"""
+    return attribute_all_dialects(data["aligned"], data["valid"], data["gold_labels"])
+
+
+# analysis stages in run order: function taking the shared data, returning its results
+ANALYSES = {
+    "reliability": run_reliability,
+    "sweep": run_sweep,
+    "significance": run_significance,
+    "cap": run_cap,
+    "rules": run_rules,
+}
+
+
+def run_analyses(data, names=ANALYSES):
+    """Run the analyses on the shared data
+    Return: {analysis: results} with the run time of each analysis"""
+    report = {}
+    for name in names:
+        print(f"{'=' * 20} {name} {'=' * 20}")
+        start = time.perf_counter()
+        report[name] = ANALYSES[name](data)
+        report[name]["seconds"] = round(time.perf_counter() - start, 3)
+        print()
+
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("analyses", nargs="*", help="analyses to run (default: all)")
+    parser.add_argument(
+        "--attribute",
+        default=DEFAULT_ATTRIBUTE,
+        help="Perspective attribute to analyse, e.g. TOXICITY, INSULT (default: TOXICITY)",
+    )
+    parser.add_argument(
+        "--scores-dir",
+        default=SCORES_DIR,
+        help="directory of the score and error files, e.g. ../scores_linear",
+    )
+    parser.add_argument(
+        "--gold-rule",
+        default=DEFAULT_RULE,
+        choices=RULES,
+        help="how the annotator labels are aggregated to gold labels (default: fewer_than_2_normal)",
+    )
+    args = parser.parse_args()
+
+    unknown = sorted(set(args.analyses) - set(ANALYSES))
+    if unknown:
+        parser.error(f"unknown analyses {unknown}, choose from {list(ANALYSES)}")
+
+    start = time.perf_counter()
+    data = load_analysis_data(args.scores_dir, args.attribute, args.gold_rule)
+    load_seconds = round(time.perf_counter() - start, 3)
+
+    # keep the run order of ANALYSES whatever order the names were given in
+    names = [name for name in ANALYSES if not args.analyses or name in args.analyses]
+    report = {
+        "attribute": args.attribute,
+        "scores_dir": args.scores_dir,
+        "gold_rule": args.gold_rule,
+        "n_instances": int(data["valid"].sum()),
+        "load_seconds": load_seconds,
+        **run_analyses(data, names),
+    }
+
+    output_name = f"analysis-report{data['suffix']}.json"
+    with open(f"../outputs/{output_name}", "w") as f:
+        json.dump(report, f, indent=4)
+    print(f"Results saved to ./outputs as {output_name} successfully!")
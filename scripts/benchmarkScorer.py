@@ -0,0 +1,167 @@
+"""Load-test the Perspective scorer of retrievePerspectiveScores.py against the local mock API
+
+Every combination of --qps, --max-in-flight and --http-batch-size scores the same texts
+against mockPerspectiveServer.py, and the throughput, the latency of the HTTP requests
+and the error accounting (failed indices vs. 429/500 answers of the server) are reported
+No API key, quota, score cache or journal is used
+
+Usage:
+    $ python benchmarkScorer.py [--n-texts 2000] [--qps 50 200] [--max-in-flight 8 32]
+        [--http-batch-size 1 20] [--latency-ms 80] [--rate-429 0.01] [--error-rate 0.01]
+        [--quota-qps 150] [--output ../outputs/benchmark-scorer.json]
+"""
+
+import os
+import json
+import time
+import argparse
+import itertools
+import contextlib
+
+import numpy as np
+
+import retrievePerspectiveScores
+from perspectiveClient import PerspectiveClient
+from mockPerspectiveServer import start_mock_server
+
+
+def load_benchmark_texts(n_texts, data_path="../data/nigerianD_full.jsonl"):
+    """Take the first n texts of a converted dataset, or synthetic texts if it is missing"""
+    texts = []
+    if os.path.exists(data_path):
+        with open(data_path) as f:
+            for line in itertools.islice(f, n_texts):
+                texts.append(json.loads(line)["text"])
+    while len(texts) < n_texts:
+        texts.append(f"synthetic benchmark comment number {len(texts)}")
+    return texts
+
+
+@contextlib.contextmanager
+def timed_requests(latencies):
+    """Record the duration of every (batch) HTTP request the scorer sends"""
+    single = retrievePerspectiveScores.get_persp_prediction
+    batch = retrievePerspectiveScores.get_persp_batch_prediction
+
+    def timed(func):
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                latencies.append(time.perf_counter() - start)
+
+        return wrapper
+
+    retrievePerspectiveScores.get_persp_prediction = timed(single)
+    retrievePerspectiveScores.get_persp_batch_prediction = timed(batch)
+    try:
+        yield
+    finally:
+        retrievePerspectiveScores.get_persp_prediction = single
+        retrievePerspectiveScores.get_persp_batch_prediction = batch
+
+
+def run_benchmark(server, texts, qps, max_in_flight, http_batch_size):
+    """Score all texts once with the given settings and collect the measurements"""
+    server.reset_stats()
+    latencies = []
+
+    start = time.perf_counter()
+    with timed_requests(latencies), contextlib.redirect_stdout(open(os.devnull, "w")):
+        scores, error_instances = retrievePerspectiveScores.score_texts(
+            texts,
+            qps=qps,
+            max_in_flight=max_in_flight,
+            http_batch_size=http_batch_size,
+        )
+    wall = time.perf_counter() - start
+
+    stats = dict(server.stats)
+    return {
+        "qps": qps,
+        "max_in_flight": max_in_flight,
+        "http_batch_size": http_batch_size,
+        "texts": len(texts),
+        "wall_seconds": round(wall, 3),
+        "texts_per_second": round(len(texts) / wall, 2),
+        "http_requests_per_second": round(stats["http_requests"] / wall, 2),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 1),
+        "scored": len(scores),
+        "failed": len(error_instances),
+        "server_429": stats["rate_limited"],
+        "server_500": stats["errors"],
+        # every rejected call must show up as exactly one failed index
+        "errors_accounted": len(error_instances)
+        == stats["rate_limited"] + stats["errors"],
+    }
+
+
+def print_report(results):
+    columns = [
+        ("qps", "qps"),
+        ("max_in_flight", "inflight"),
+        ("http_batch_size", "batch"),
+        ("texts_per_second", "texts/s"),
+        ("http_requests_per_second", "http/s"),
+        ("latency_p50_ms", "p50 ms"),
+        ("latency_p99_ms", "p99 ms"),
+        ("failed", "failed"),
+        ("server_429", "429"),
+        ("server_500", "500"),
+        ("errors_accounted", "accounted"),
+    ]
+    print(" ".join(f"{title:>9}" for _, title in columns))
+    for result in results:
+        print(" ".join(f"{str(result[key]):>9}" for key, _ in columns))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-texts", type=int, default=2000)
+    parser.add_argument("--qps", type=float, nargs="+", default=[50.0, 200.0])
+    parser.add_argument("--max-in-flight", type=int, nargs="+", default=[8, 32])
+    parser.add_argument("--http-batch-size", type=int, nargs="+", default=[1, 20])
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--quota-qps", type=float, default=None)
+    parser.add_argument("--output", default=None, help="also save the results as json")
+    args = parser.parse_args()
+
+    server = start_mock_server(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        error_rate=args.error_rate,
+        quota_qps=args.quota_qps,
+    )
+    # the scorer's shared client talks to the mock server
+    retrievePerspectiveScores._client = PerspectiveClient(
+        "mock-key",
+        discovery_url=f"{server.url}/$discovery/rest?version=v1alpha1",
+        discovery_cache=None,
+    )
+    texts = load_benchmark_texts(args.n_texts)
+
+    results = []
+    for qps, max_in_flight, http_batch_size in itertools.product(
+        args.qps, args.max_in_flight, args.http_batch_size
+    ):
+        print(
+            f"Benchmarking qps={qps} max_in_flight={max_in_flight}"
+            f" http_batch_size={http_batch_size} ..."
+        )
+        results.append(
+            run_benchmark(server, texts, qps, max_in_flight, http_batch_size)
+        )
+
+    print()
+    print_report(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"Results saved to {args.output}")
+    server.shutdown()
@@ -8,85 +8,40 @@ Prequisites:
     - error indices of all batches for all 4 dialects in json format
 
 Usage:
-    $ python checkPerspectiveReliability.py
+    $ python checkPerspectiveReliability.py [--attribute TOXICITY] [--scores-dir ../scores]
+        [--gold-rule fewer_than_2_normal] [--sweep]
+    --sweep: also compare gold and Perspective labels at every threshold instead of 0.5 only
+
+Outputs (--sweep):
+    - To ./outputs: threshold-sweep.json, ROC AUC, average precision, best F1 and the
+      results at 0.5 of every variant
+    - To ./outputs: threshold-sweep.npz, the confusion matrix, Chi-square and curves at every threshold
+    - To ./outputs: threshold-curves.png, ROC and precision-recall curves of all variants
+    (other attributes, scores directories or gold rules get their name as file name suffix)
 """
 
 import pandas as pd
+import numpy as np
 import json
+import argparse
+import matplotlib.pyplot as plt
 
 from scipy.stats import chi2_contingency
 
+from alignScores import load_aligned_scores
+from goldLabels import load_gold_index, rule_suffix, DEFAULT_RULE, RULES
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR
+from thresholdSweep import sweep_thresholds, curve_summary
 
-def process_batch(batchn):
-    """Process one batch, drop errors from the scores and
-    Return the scores and the list of error indices across all 5 variants"""
-    og_scores = list(
-        pd.read_csv(f"../scores/persp_score_original_{batchn}.csv")["score"]
-    )
-    aave_scores = list(pd.read_csv(f"../scores/persp_score_aave_{batchn}.csv")["score"])
-    nigerianD_scores = list(
-        pd.read_csv(f"../scores/persp_score_nigerianD_{batchn}.csv")["score"]
-    )
-    indianD_scores = list(
-        pd.read_csv(f"../scores/persp_score_indianD_{batchn}.csv")["score"]
-    )
-    singlish_scores = list(
-        pd.read_csv(f"../scores/persp_score_singlish_{batchn}.csv")["score"]
-    )
-
-    og_errors = json.load(open(f"../scores/errors_original_{batchn}.json"))
-    aave_errors = json.load(open(f"../scores/errors_aave_{batchn}.json"))
-    nigerianD_errors = json.load(open(f"../scores/errors_nigerianD_{batchn}.json"))
-    indianD_errors = json.load(open(f"../scores/errors_indianD_{batchn}.json"))
-    singlish_errors = json.load(open(f"../scores/errors_singlish_{batchn}.json"))
-
-    for idx in og_errors:
-        og_scores.insert(idx, 0)
-    for idx in aave_errors:
-        aave_scores.insert(idx, 0)
-    for idx in nigerianD_errors:
-        nigerianD_scores.insert(idx, 0)
-    for idx in indianD_errors:
-        indianD_scores.insert(idx, 0)
-    for idx in singlish_errors:
-        singlish_scores.insert(idx, 0)
-
-    # instances that are not processed by PerspectiveAPI in the current batch
-    to_drop = sorted(
-        list(
-            set(
-                og_errors
-                + aave_errors
-                + nigerianD_errors
-                + indianD_errors
-                + singlish_errors
-            )
-        ),
-        reverse=True,
-    )
-
-    for idx in to_drop:
-        del og_scores[idx]
-        del aave_scores[idx]
-        del nigerianD_scores[idx]
-        del indianD_scores[idx]
-        del singlish_scores[idx]
-
-    return (
-        og_scores,
-        aave_scores,
-        nigerianD_scores,
-        indianD_scores,
-        singlish_scores,
-        to_drop,
-    )
+THRESHOLD = 0.5
 
 
 def print_results(
     og_scores, aave_scores, nigerianD_scores, indianD_scores, singlish_scores
 ):
     """Print the number of comments tagged as toxic by PerspectiveAPI in each variant
-    Threshold: if scores > 0.5, the comment is toxic"""
+    Threshold: if scores > 0.5, the comment is toxic
+    Return: {variant: {"toxic": count, "total": count}}"""
     og_tox = [score for score in og_scores if score > 0.5]
     aave_tox = [score for score in aave_scores if score > 0.5]
     nigeriand_tox = [score for score in nigerianD_scores if score > 0.5]
@@ -103,24 +58,24 @@ def print_results(
         "Singlish: ", len(singlish_tox), "(toxic) /", len(singlish_scores), "(total)\n"
     )
 
-    return True
+    return {
+        "Original": {"toxic": len(og_tox), "total": len(og_scores)},
+        "AAVE": {"toxic": len(aave_tox), "total": len(aave_scores)},
+        "NigerianD": {"toxic": len(nigeriand_tox), "total": len(nigerianD_scores)},
+        "IndianD": {"toxic": len(indind_tox), "total": len(indianD_scores)},
+        "Singlish": {"toxic": len(singlish_tox), "total": len(singlish_scores)},
+    }
 
 
-def check_perspective_credibility(hatexplain_df, og_scores, to_drop):
+def check_perspective_credibility(gold_labels, og_scores):
     """Compare gold labels with PerspectiveAPI's labels on the toxicity HateXplain dataset
-    Use the Chi-square test to check the Trur/False of the null hypothesis"""
-    gold_labels = []
-    for i in range(len(hatexplain_df)):
-        annotations = [an["label"] for an in hatexplain_df["annotators"].iloc[i]]
-        # if less than two annotators labeled current sentence as normal, consider it toxic
-        if annotations.count("normal") < 2:
-            gold_labels.append(1)
-        else:
-            gold_labels.append(0)
-
-    # drop error indices by Perspective also from gold labels
-    for idx in to_drop:
-        del gold_labels[idx]
+    Use the Chi-square test to check the Trur/False of the null hypothesis
+    Input: gold labels and scores of the aligned instances, undecided (-1) gold labels are left out
+    Return: counts of gold and Perspective toxic instances, Chi-square statistic and p-value
+    """
+    decided = gold_labels != -1
+    gold_labels = gold_labels[decided].tolist()
+    og_scores = np.asarray(og_scores)[decided].tolist()
 
     # indices of instances that are gold toxic
     gtox_idx = [i for i in range(len(gold_labels)) if gold_labels[i] == 1]
@@ -153,34 +108,124 @@ def check_perspective_credibility(hatexplain_df, og_scores, to_drop):
     # p == 0 < 0.05, reject the null hypothesis, the two categorical variables are dependent
     # which means, the PerspectiveAPI's labels is credible for the toxicity evaluation for the HateXplain dataset
 
-    return True
+    return {
+        "gold_toxic": len(gtox_idx),
+        "perspective_toxic": len(tox_idx_persp_og),
+        "chi2": chi2,
+        "p_value": p,
+    }
+
+
+def sweep_credibility(gold_labels, aligned, suffix=""):
+    """Compare gold labels with the labels of all variants at every threshold in one pass
+    Input: gold labels and {variant: scores} of the aligned instances, undecided (-1) gold labels are left out
+    Return: {variant: summary}, summary: ROC AUC, average precision, best F1, results at 0.5
+    and the threshold at which the variant tags as many instances toxic as the original at 0.5
+    """
+    decided = gold_labels != -1
+    variants = list(aligned)
+    scores = np.stack([aligned[variant][decided] for variant in variants])
+    thresholds = np.union1d(np.append(np.unique(scores), np.inf), [THRESHOLD])
+    sweep = sweep_thresholds(scores, gold_labels[decided], thresholds)
+
+    summary = curve_summary(sweep, variants)
+    at = np.searchsorted(thresholds, THRESHOLD)
+    tagged = sweep["tp"] + sweep["fp"]
+    for v, variant in enumerate(variants):
+        # calibration: threshold of the variant matching the toxic rate of the original at 0.5
+        matched = np.argmin(np.abs(tagged[v] - tagged[0, at]))
+        summary[variant].update(
+            {
+                f"{key}_at_{THRESHOLD}": float(sweep[key][v, at])
+                for key in ["precision", "recall", "f1", "chi2", "p_value"]
+            }
+        )
+        summary[variant]["matched_threshold"] = float(thresholds[matched])
+
+        print(
+            f"{variant:<10}",
+            f"ROC AUC: {summary[variant]['roc_auc']:.4f}",
+            f"AP: {summary[variant]['average_precision']:.4f}",
+            f"best F1: {summary[variant]['best_f1']:.4f}",
+            f"(>= {summary[variant]['best_f1_threshold']:.4f})",
+            f"threshold matching the original: {summary[variant]['matched_threshold']:.4f}",
+        )
+
+    # save the curves at every threshold and the summary
+    with open(f"../outputs/threshold-sweep{suffix}.json", "w") as f:
+        json.dump(summary, f, indent=4)
+    np.savez_compressed(
+        f"../outputs/threshold-sweep{suffix}.npz",
+        variants=variants,
+        **sweep,
+    )
+
+    # ROC and precision-recall curves of all variants
+    fig, ax = plt.subplots(ncols=2, figsize=(12, 5))
+    for v, variant in enumerate(variants):
+        ax[0].plot(sweep["fpr"][v], sweep["recall"][v], label=variant)
+        ax[1].plot(sweep["recall"][v], sweep["precision"][v], label=variant)
+    ax[0].plot([0, 1], [0, 1], color="slategrey", linestyle="--", linewidth=1)
+    ax[0].set_xlabel("False positive rate")
+    ax[0].set_ylabel("True positive rate")
+    ax[0].set_title("ROC curves")
+    ax[1].set_xlabel("Recall")
+    ax[1].set_ylabel("Precision")
+    ax[1].set_title("Precision-recall curves")
+    ax[1].legend(loc="lower left")
+    plt.savefig(f"../outputs/threshold-curves{suffix}.png", bbox_inches="tight")
+    plt.close(fig)
+
+    return summary
 
 
 if __name__ == "__main__":
-    # original HateXplain dataset with gold annotation labels
-    hatexplain_df = pd.read_json(f"../data/hatexplain_original.json").transpose()
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--attribute",
+        default=DEFAULT_ATTRIBUTE,
+        help="Perspective attribute to analyse, e.g. TOXICITY, INSULT (default: TOXICITY)",
+    )
+    parser.add_argument(
+        "--scores-dir",
+        default=SCORES_DIR,
+        help="directory of the score and error files, e.g. ../scores_linear",
+    )
+    parser.add_argument(
+        "--gold-rule",
+        default=DEFAULT_RULE,
+        choices=RULES,
+        help="how the annotator labels are aggregated to gold labels (default: fewer_than_2_normal)",
+    )
+    parser.add_argument(
+        "--sweep",
+        action="store_true",
+        help="also sweep the threshold, save curves and results at every threshold",
+    )
+    args = parser.parse_args()
 
-    og1, aave1, nigerianD1, indianD1, singlish1, to_drop1 = process_batch("batch1")
-    og2, aave2, nigerianD2, indianD2, singlish2, to_drop2 = process_batch("batch2")
-    og3, aave3, nigerianD3, indianD3, singlish3, to_drop3 = process_batch("batch3")
-    og4, aave4, nigerianD4, indianD4, singlish4, to_drop4 = process_batch("batch4")
+    # gold labels of the original HateXplain dataset
+    gold = load_gold_index()
 
-    og_scores = og1 + og2 + og3 + og4
-    aave_scores = aave1 + aave2 + aave3 + aave4
-    nigerianD_scores = nigerianD1 + nigerianD2 + nigerianD3 + nigerianD4
-    indianD_scores = indianD1 + indianD2 + indianD3 + indianD4
-    singlish_scores = singlish1 + singlish2 + singlish3 + singlish4
+    # scores of all variants, aligned over the instances scored in every variant
+    aligned, valid = load_aligned_scores(args.scores_dir, args.attribute)
+    og_scores = aligned["original"].tolist()
+    aave_scores = aligned["aave"].tolist()
+    nigerianD_scores = aligned["nigerianD"].tolist()
+    indianD_scores = aligned["indianD"].tolist()
+    singlish_scores = aligned["singlish"].tolist()
 
     # check overall scoring resutts by PerspectiveAPI OG and all 4 dialects
     print_results(
         og_scores, aave_scores, nigerianD_scores, indianD_scores, singlish_scores
     )
 
-    # collect all error indexes by adding the offset
-    to_drop2 = [i + 5000 for i in to_drop2]
-    to_drop3 = [i + 10000 for i in to_drop3]
-    to_drop4 = [i + 15000 for i in to_drop4]
-    to_drop = sorted(to_drop1 + to_drop2 + to_drop3 + to_drop4, reverse=True)
-
     # perform statistical test to check the similarity between gold labels and PerspectiveAPI's labels
-    check_perspective_credibility(hatexplain_df, og_scores, to_drop)
+    check_perspective_credibility(gold.labels(args.gold_rule)[valid], og_scores)
+
+    if args.sweep:
+        print("\nThreshold sweep of all variants")
+        suffix = output_suffix(args.attribute, args.scores_dir) + rule_suffix(
+            args.gold_rule
+        )
+        sweep_credibility(gold.labels(args.gold_rule)[valid], aligned, suffix)
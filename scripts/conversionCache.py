@@ -0,0 +1,87 @@
+"""Persistent cache of multi-value dialect conversions (SQLite)
+
+A cache entry is keyed by the hash of the dialect class, the rule-set version and the sentence,
+and holds the converted text with the types of the executed rules, so duplicated posts and
+re-runs (after a crash or with other options) skip the transform
+Bump the rule-set version when switching to another multi-value commit
+
+Usage (next to convertTo4Dialects.py in the multi-value root directory):
+    from conversionCache import ConversionCache
+    cache = ConversionCache()
+    sent_dict = cache.get("NigerianDialect", sent)  # None on a cache miss
+    cache.put("NigerianDialect", sent, {"text": ..., "rules": [...]})
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+
+CONVERSION_CACHE = "./conversion_cache.sqlite"
+RULESET_VERSION = "multi-value@bf1aea58303ea70d8d380294f97886d821a940a2"
+
+
+class ConversionCache:
+    """Map (dialect class, rule-set version, sentence) to the converted sentence and its rules"""
+
+    def __init__(
+        self, path=CONVERSION_CACHE, ruleset_version=RULESET_VERSION, commit_every=100
+    ):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversions (key TEXT PRIMARY KEY, conversion TEXT NOT NULL)"
+        )
+        self.ruleset_version = ruleset_version
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, dialect_class, sent):
+        """Return the cache key of a sentence converted by a dialect class"""
+        payload = "\x1f".join([dialect_class, self.ruleset_version, sent])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, dialect_class, sent):
+        """Return the cached conversion as {text: ..., rules: [...]}, or None if not cached"""
+        row = self.conn.execute(
+            "SELECT conversion FROM conversions WHERE key = ?",
+            (self.key(dialect_class, sent),),
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, dialect_class, sent, sent_dict):
+        """Store the conversion {text: ..., rules: [...]} of a sentence"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO conversions (key, conversion) VALUES (?, ?)",
+            (self.key(dialect_class, sent), json.dumps(sent_dict)),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        """Print hits, misses and the hit rate since the cache was opened"""
+        print(
+            f"Conversion cache: {self.hits} hits / {self.misses} misses"
+            f" (hit rate {self.hit_rate():.2%})"
+        )
+
+    def close(self):
+        self.commit()
+        self.conn.close()
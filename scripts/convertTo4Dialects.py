@@ -3,62 +3,329 @@
 Prequisites:
 - clone multi-value repo and switch to version bf1aea58303ea70d8d380294f97886d821a940a2
     - git clone git@github.com:SALT-NLP/multi-value.git
-    - git checkout bf1aea58303ea70d8d380294f97886d821a940a2 
+    - git checkout bf1aea58303ea70d8d380294f97886d821a940a2
 - install requirements from REQUIREMENTS_MultiV.txt
-- move this script and the HateXplain dataset (../data/hatexplain_original.json) to the multi-value root directory
+- move this script, conversionCache.py, parseCache.py and the HateXplain dataset
+  (../data/hatexplain_original.json) to the multi-value root directory
 
 - Usage:
     from the multi-value root directory run:
-    $ python convertTo4Dialects.py
+    $ python convertTo4Dialects.py [--workers 8] [--shard-size 100] [--dialects aave singlish] [--resume]
+
+    With more than one worker, the rows are split into shards and converted by process pools,
+    one pool per dialect whose workers build their dialect object once
+    --workers 1 converts the dialects one after another in this process
+
+    Every converted sentence is written to {dialect}.jsonl as soon as it is in input order,
+    one line {post_id: ..., text: ..., rules: [...]} per HateXplain post
+    --resume keeps the complete lines of existing outputs and continues after them
+
+    Conversions are cached in ./conversion_cache.sqlite by dialect, rule-set version and sentence,
+    duplicated posts and re-runs are not converted again (--no-cache to convert everything)
+
+    Before converting, a pre-pass parses every distinct sentence once with spaCy and stores the
+    parses in ./parse_cache.sqlite, all dialect objects read them from there instead of parsing
+    the same sentence once per dialect (--no-parse-cache to let every dialect parse)
 """
 
-import pandas as pd
+import os
 import json
+import argparse
+import pandas as pd
+from itertools import zip_longest
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from tqdm import tqdm
 
+from conversionCache import ConversionCache, CONVERSION_CACHE, RULESET_VERSION
+from parseCache import ParseCache, PARSE_CACHE, parse_prepass, install_parse_cache
+
 from src.Dialects import AfricanAmericanVernacular
 from src.Dialects import NigerianDialect
 from src.Dialects import ColloquialSingaporeDialect
 from src.Dialects import IndianDialect
 
+DIALECTS = {
+    "aave": AfricanAmericanVernacular,
+    "nigerianD": NigerianDialect,
+    "indianD": IndianDialect,
+    "singlish": ColloquialSingaporeDialect,
+}
+
+_dialect = None  # dialect object of a pool worker, built once by init_worker
+
+
+def convert_sentence(dialect, sent):
+    """Convert one sentence and collect the types of the applied rules
+    Return: {text: ..., rules: [...]}"""
+    sent_dict = {}
+    sent_dict["text"] = dialect.convert_sae_to_dialect(sent)
+    sent_dict["rules"] = list(set([i["type"] for i in dialect.executed_rules.values()]))
+
+    return sent_dict
+
+
+def save_dialect_sents(sents, post_ids, outfile):
+    """Append converted sentences with their post ids and flush them to disk"""
+    for post_id, entry in zip(post_ids, sents):
+        json.dump({"post_id": post_id, **entry}, outfile)
+        outfile.write("\n")
+    outfile.flush()
+
+
+def completed_rows(path, post_ids):
+    """Count the complete lines of an existing output, which must follow the input order
+    Return: tuple (number of completed rows, byte size of the complete lines)"""
+    n_done = 0
+    size = 0
+    with open(path, "rb") as f:
+        for line in f:
+            if not line.endswith(b"\n"):
+                break  # torn last line of an interrupted run
+            try:
+                post_id = json.loads(line)["post_id"]
+            except (ValueError, KeyError):
+                break
+            if n_done >= len(post_ids) or post_id != post_ids[n_done]:
+                raise ValueError(
+                    f"{path}: line {n_done + 1} has post id {post_id}, "
+                    "the output does not belong to this dataset"
+                )
+            n_done += 1
+            size += len(line)
+    return n_done, size
+
+
+def open_dialect_output(dialect_name, post_ids, resume=False):
+    """Open {dialect}.jsonl for writing, after its complete lines when resuming
+    Return: tuple (file opened for appending, number of completed rows)"""
+    path = f"{dialect_name}.jsonl"
+    if not resume or not os.path.exists(path):
+        return open(path, "w"), 0
+
+    n_done, size = completed_rows(path, post_ids)
+    outfile = open(path, "a")
+    outfile.truncate(size)  # drop a torn last line
+    return outfile, n_done
+
 
-def transform_to_dialect(dialect, df, dialect_name):
+def transform_to_dialect(dialect, df, dialect_name, resume=False, cache=None):
     """Take one dialect transform module and apply it to the HateXplain dataset
-    Save the results in a jsonl file"""
-    sents = []  # {text: ..., rules: [...]}
+    Save the results in a jsonl file, sentences in the conversion cache are not converted again
+    """
+    post_ids = list(df.index)
+    outfile, n_done = open_dialect_output(dialect_name, post_ids, resume)
 
-    for i in tqdm(range(len(df)), desc="Processing"):
-        sent = " ".join(df["post_tokens"][0])  # load original sentece
+    with outfile:
+        for i in tqdm(
+            range(n_done, len(df)), desc="Processing", initial=n_done, total=len(df)
+        ):
+            sent = " ".join(df["post_tokens"].iloc[i])  # load original sentece
+            sent_dict = cache.get(type(dialect).__name__, sent) if cache else None
+            if sent_dict is None:
+                sent_dict = convert_sentence(dialect, sent)
+                if cache:
+                    cache.put(type(dialect).__name__, sent, sent_dict)
+            save_dialect_sents([sent_dict], [post_ids[i]], outfile)
 
-        sent_dict = {}
-        sent_dict["text"] = dialect.convert_sae_to_dialect(sent)
-        sent_dict["rules"] = list(
-            set([i["type"] for i in dialect.executed_rules.values()])
+    return True
+
+
+def load_dialect(dialect_name, parse_cache_path=None):
+    """Build a dialect object, taking its parses from the parse cache if given"""
+    dialect = DIALECTS[dialect_name]()
+    if parse_cache_path:
+        install_parse_cache(dialect, ParseCache(parse_cache_path, read_only=True))
+    return dialect
+
+
+def run_parse_prepass(df, dialect_name, parse_cache_path):
+    """Parse every distinct sentence once with the spaCy pipeline of the dialects"""
+    sents = [" ".join(tokens) for tokens in df["post_tokens"]]
+    parse_cache = ParseCache(parse_cache_path)
+    n_parsed = parse_prepass(sents, DIALECTS[dialect_name]().nlp, parse_cache)
+    parse_cache.close()
+    print(f"Parsed {n_parsed} new sentences into {parse_cache_path}")
+
+    return True
+
+
+def init_worker(dialect_name, parse_cache_path=None):
+    global _dialect
+    _dialect = load_dialect(dialect_name, parse_cache_path)
+
+
+def convert_shard(start, sents):
+    """Convert a shard of sentences with the dialect of this worker
+    Return: tuple (index of the first sentence, list of converted sentences)"""
+    return start, [convert_sentence(_dialect, sent) for sent in sents]
+
+
+def transform_parallel(
+    df,
+    dialect_names,
+    workers,
+    shard_size,
+    resume=False,
+    cache=None,
+    parse_cache_path=None,
+):
+    """Convert the HateXplain dataset to several dialects with one process pool per dialect
+    Cached sentences are taken from the cache, the others are converted once per distinct
+    sentence; every dialect is written to {dialect}.jsonl in input order as soon as
+    all rows before are done"""
+    sents = [" ".join(tokens) for tokens in df["post_tokens"]]
+    post_ids = list(df.index)
+    workers_per_dialect = max(1, workers // len(dialect_names))
+
+    pools = {}
+    futures = {}  # future: dialect name
+    outfiles = {}
+    n_done = {}  # rows of each dialect written by an earlier run (--resume)
+    next_start = {}  # first row of each dialect that is not written yet
+    converted = {}  # converted sentence of every row, None until done
+    pending = {}  # (distinct sentence to convert, rows with this sentence) per dialect
+
+    def write_done_rows(name):
+        start = next_start[name]
+        while (
+            next_start[name] < len(sents)
+            and converted[name][next_start[name]] is not None
+        ):
+            next_start[name] += 1
+        save_dialect_sents(
+            converted[name][start : next_start[name]],
+            post_ids[start : next_start[name]],
+            outfiles[name],
         )
 
-        sents.append(sent_dict)
+    try:
+        for name in dialect_names:
+            outfiles[name], n_done[name] = open_dialect_output(name, post_ids, resume)
+            next_start[name] = n_done[name]
+            converted[name] = [None] * len(sents)
+            pending[name] = {}
+            for i in range(next_start[name], len(sents)):
+                sent_dict = (
+                    cache.get(DIALECTS[name].__name__, sents[i]) if cache else None
+                )
+                if sent_dict is None:
+                    pending[name].setdefault(sents[i], []).append(i)
+                else:
+                    converted[name][i] = sent_dict
+            write_done_rows(name)
+            if pending[name]:
+                pools[name] = ProcessPoolExecutor(
+                    workers_per_dialect,
+                    initializer=init_worker,
+                    initargs=(name, parse_cache_path),
+                )
+            pending[name] = list(pending[name].items())
+
+        # submit shard by shard across the dialects, so all dialects progress together
+        shard_starts = [
+            [(name, start) for start in range(0, len(pending[name]), shard_size)]
+            for name in dialect_names
+        ]
+        for shards in zip_longest(*shard_starts):
+            for name, start in filter(None, shards):
+                shard = [sent for sent, _ in pending[name][start : start + shard_size]]
+                futures[pools[name].submit(convert_shard, start, shard)] = name
 
-    with open(f"{dialect_name}.jsonl", "w") as outfile:
-        for entry in sents:
-            json.dump(entry, outfile)
-            outfile.write("\n")
+        with tqdm(
+            total=len(sents) * len(dialect_names),
+            # rows written before a resume and rows served from the cache
+            initial=sum(n_done.values())
+            + sum(c is not None for name in dialect_names for c in converted[name]),
+            desc="Processing",
+        ) as pbar:
+            for future in as_completed(futures):
+                name = futures[future]
+                start, shard = future.result()
+                for (sent, rows), sent_dict in zip(pending[name][start:], shard):
+                    if cache:
+                        cache.put(DIALECTS[name].__name__, sent, sent_dict)
+                    for i in rows:
+                        converted[name][i] = sent_dict
+                    pbar.update(len(rows))
+                write_done_rows(name)
+                pbar.set_postfix(
+                    {n: f"{next_start[n] / len(sents):.0%}" for n in dialect_names}
+                )
+    finally:
+        for pool in pools.values():
+            pool.shutdown(cancel_futures=True)
+        for outfile in outfiles.values():
+            outfile.close()
 
     return True
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of worker processes over all dialects (default: all cores)",
+    )
+    parser.add_argument(
+        "--shard-size", type=int, default=100, help="sentences per worker task"
+    )
+    parser.add_argument(
+        "--dialects", nargs="+", default=list(DIALECTS), choices=list(DIALECTS)
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="continue after the complete lines of existing outputs",
+    )
+    parser.add_argument("--cache", default=CONVERSION_CACHE, help="conversion cache")
+    parser.add_argument(
+        "--no-cache", action="store_true", help="convert every sentence again"
+    )
+    parser.add_argument(
+        "--ruleset-version",
+        default=RULESET_VERSION,
+        help="version of the multi-value rules, part of the cache key",
+    )
+    parser.add_argument("--parse-cache", default=PARSE_CACHE, help="spaCy parse cache")
+    parser.add_argument(
+        "--no-parse-cache",
+        action="store_true",
+        help="no shared parse pre-pass, every dialect parses the sentences itself",
+    )
+    args = parser.parse_args()
+
     # read in the original HateXplain dataset
     df = pd.read_json(f"./hatexplain_original.json").transpose()
 
-    # load and run AAVE transform module, save results
-    aave = AfricanAmericanVernacular()
-    transform_to_dialect(dialect=aave, df=df, dialect_name="aave")
-    # load and run Nigerian dialect transform module, save results
-    ngd = NigerianDialect()
-    transform_to_dialect(dialect=ngd, df=df, dialect_name="nigerianD")
-    # load and run HongKong dialect transform module, save results
-    indd = IndianDialect()
-    transform_to_dialect(dialect=indd, df=df, dialect_name="indianD")
-    # load and run Singlish dialect transform module, save results
-    csgd = ColloquialSingaporeDialect()
-    transform_to_dialect(dialect=csgd, df=df, dialect_name="singlish")
+    parse_cache_path = None if args.no_parse_cache else args.parse_cache
+    if parse_cache_path:
+        run_parse_prepass(df, args.dialects[0], parse_cache_path)
+
+    cache = None if args.no_cache else ConversionCache(args.cache, args.ruleset_version)
+    try:
+        if args.workers > 1:
+            transform_parallel(
+                df,
+                args.dialects,
+                args.workers,
+                args.shard_size,
+                args.resume,
+                cache,
+                parse_cache_path,
+            )
+        else:
+            for name in args.dialects:
+                # load and run the dialect transform module, save results
+                transform_to_dialect(
+                    dialect=load_dialect(name, parse_cache_path),
+                    df=df,
+                    dialect_name=name,
+                    resume=args.resume,
+                    cache=cache,
+                )
+    finally:
+        if cache:
+            cache.report()
+            cache.close()
@@ -0,0 +1,194 @@
+"""Long-running dialect conversion service over a local unix socket
+
+Building the multi-value dialect objects takes long, the server builds them once and keeps
+them warm; clients send batches of sentences and get the converted text and rules back
+Protocol: one json object per line in both directions
+    {"dialect": "aave", "sents": ["...", ...]} -> {"results": [{"text": ..., "rules": [...]}, ...]}
+    {"cmd": "dialects"} -> {"dialects": ["aave", ...]}
+    {"cmd": "shutdown"} -> {"ok": true, "shutdown": true}, the server stops
+    errors -> {"error": "..."}
+
+Usage (next to convertTo4Dialects.py in the multi-value root directory):
+    $ python dialectServer.py serve [--socket ./dialect_server.sock] [--dialects aave singlish]
+    convert one sentence per line of a text file, results as jsonl ({text: ..., rules: [...]}):
+    $ python dialectServer.py convert --dialect aave [--batch-size 64] < sents.txt > aave.jsonl
+
+    from dialectServer import DialectClient
+    with DialectClient() as client:
+        results = client.convert("aave", ["i am not going"])
+"""
+
+import os
+import sys
+import json
+import socket
+import argparse
+import threading
+import socketserver
+
+DIALECT_SOCKET = "./dialect_server.sock"
+
+
+class DialectRequestHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        # one connection can send any number of requests
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                response = self.server.answer(json.loads(line))
+            except Exception as e:
+                response = {"error": f"{type(e).__name__}: {e}"}
+            self.wfile.write((json.dumps(response) + "\n").encode("utf-8"))
+            self.wfile.flush()
+            if response.get("shutdown"):
+                # shutdown() waits for serve_forever, which runs in another thread
+                threading.Thread(target=self.server.shutdown).start()
+                return
+
+
+class DialectServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server holding one warm object per dialect"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path, dialects):
+        from convertTo4Dialects import convert_sentence
+
+        if os.path.exists(socket_path):
+            os.remove(socket_path)  # left over by a server that was killed
+        super().__init__(socket_path, DialectRequestHandler)
+        self.dialects = dialects
+        # dialect objects keep the state of the current sentence, one conversion at a time
+        self.locks = {name: threading.Lock() for name in dialects}
+        self.convert_sentence = convert_sentence
+
+    def answer(self, request):
+        if request.get("cmd") == "dialects":
+            return {"dialects": list(self.dialects)}
+        if request.get("cmd") == "shutdown":
+            return {"ok": True, "shutdown": True}
+
+        name = request.get("dialect")
+        if name not in self.dialects:
+            return {"error": f"Unknown dialect {name}, served: {list(self.dialects)}"}
+        with self.locks[name]:
+            results = [
+                self.convert_sentence(self.dialects[name], sent)
+                for sent in request["sents"]
+            ]
+        return {"results": results}
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+
+
+def serve(socket_path, dialect_names, parse_cache_path=None):
+    """Build the dialect objects and answer requests until shutdown"""
+    from convertTo4Dialects import load_dialect
+
+    dialects = {}
+    for name in dialect_names:
+        print(f"Loading {name}...", file=sys.stderr)
+        dialects[name] = load_dialect(name, parse_cache_path)
+
+    with DialectServer(socket_path, dialects) as server:
+        print(f"Serving {dialect_names} on {socket_path}", file=sys.stderr)
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
+    return True
+
+
+class DialectClient:
+    """Client of a running DialectServer, without importing multi-value"""
+
+    def __init__(self, socket_path=DIALECT_SOCKET):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(socket_path)
+        self.rfile = self.sock.makefile("rb")
+
+    def request(self, payload):
+        self.sock.sendall((json.dumps(payload) + "\n").encode("utf-8"))
+        response = json.loads(self.rfile.readline())
+        if "error" in response:
+            raise RuntimeError(response["error"])
+        return response
+
+    def convert(self, dialect, sents):
+        """Convert a batch of sentences
+        Return: list of {text: ..., rules: [...]} in input order"""
+        return self.request({"dialect": dialect, "sents": list(sents)})["results"]
+
+    def dialects(self):
+        return self.request({"cmd": "dialects"})["dialects"]
+
+    def shutdown(self):
+        return self.request({"cmd": "shutdown"})
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def convert_stream(client, dialect, infile, outfile, batch_size=64):
+    """Convert one sentence per line of infile, write one json result per line to outfile"""
+    batch = []
+    for line in infile:
+        batch.append(line.rstrip("\n"))
+        if len(batch) == batch_size:
+            for result in client.convert(dialect, batch):
+                outfile.write(json.dumps(result) + "\n")
+            batch = []
+    if batch:
+        for result in client.convert(dialect, batch):
+            outfile.write(json.dumps(result) + "\n")
+
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--socket", default=DIALECT_SOCKET)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="start the server")
+    serve_parser.add_argument(
+        "--dialects",
+        nargs="+",
+        default=["aave", "nigerianD", "indianD", "singlish"],
+        help="dialects to keep warm",
+    )
+    serve_parser.add_argument(
+        "--parse-cache",
+        default=None,
+        help="spaCy parse cache of convertTo4Dialects.py to read parses from",
+    )
+
+    convert_parser = commands.add_parser(
+        "convert", help="convert stdin (one sentence per line) to jsonl on stdout"
+    )
+    convert_parser.add_argument("--dialect", required=True)
+    convert_parser.add_argument("--batch-size", type=int, default=64)
+
+    commands.add_parser("shutdown", help="stop the server")
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        serve(args.socket, args.dialects, args.parse_cache)
+    elif args.command == "convert":
+        with DialectClient(args.socket) as client:
+            convert_stream(client, args.dialect, sys.stdin, sys.stdout, args.batch_size)
+    else:
+        with DialectClient(args.socket) as client:
+            client.shutdown()
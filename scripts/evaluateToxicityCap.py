@@ -7,117 +7,29 @@ Question:
         - if the original text is non-toxic, the dialect text could get more toxic more easily due to various dialect specific features
 
 Usage:
-    $ python evaluateToxicityCap.py
+    $ python evaluateToxicityCap.py [--attribute TOXICITY] [--scores-dir ../scores]
+        [--gold-rule fewer_than_2_normal] [--workers 4] [--rasterize]
 
 Outputs:
     - To ./outputs: boxplots of all scores across original and dialects
     - To ./outputs: boxplots of score changes of each instance for each dialect compared to original
+    (other attributes, scores directories or gold rules get their name as file name suffix)
 """
 
-import pandas as pd
+import os
 import numpy as np
-import json
+import argparse
 import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib.collections import LineCollection
 
-def process_batch(batchn):
-    """Process one batch, drop errors from the scores and
-    Return the scores and the list of error indices across all 5 variants"""
-    og_scores = list(
-        pd.read_csv(f"../scores/persp_score_original_{batchn}.csv")["score"]
-    )
-    aave_scores = list(pd.read_csv(f"../scores/persp_score_aave_{batchn}.csv")["score"])
-    nigerianD_scores = list(
-        pd.read_csv(f"../scores/persp_score_nigerianD_{batchn}.csv")["score"]
-    )
-    indianD_scores = list(
-        pd.read_csv(f"../scores/persp_score_indianD_{batchn}.csv")["score"]
-    )
-    singlish_scores = list(
-        pd.read_csv(f"../scores/persp_score_singlish_{batchn}.csv")["score"]
-    )
-
-    og_errors = json.load(open(f"../scores/errors_original_{batchn}.json"))
-    aave_errors = json.load(open(f"../scores/errors_aave_{batchn}.json"))
-    nigerianD_errors = json.load(open(f"../scores/errors_nigerianD_{batchn}.json"))
-    indianD_errors = json.load(open(f"../scores/errors_indianD_{batchn}.json"))
-    singlish_errors = json.load(open(f"../scores/errors_singlish_{batchn}.json"))
-
-    for idx in og_errors:
-        og_scores.insert(idx, 0)
-    for idx in aave_errors:
-        aave_scores.insert(idx, 0)
-    for idx in nigerianD_errors:
-        nigerianD_scores.insert(idx, 0)
-    for idx in indianD_errors:
-        indianD_scores.insert(idx, 0)
-    for idx in singlish_errors:
-        singlish_scores.insert(idx, 0)
-
-    # instances that are not processed by PerspectiveAPI in the current batch
-    to_drop = sorted(
-        list(
-            set(
-                og_errors
-                + aave_errors
-                + nigerianD_errors
-                + indianD_errors
-                + singlish_errors
-            )
-        ),
-        reverse=True,
-    )
-
-    for idx in to_drop:
-        del og_scores[idx]
-        del aave_scores[idx]
-        del nigerianD_scores[idx]
-        del indianD_scores[idx]
-        del singlish_scores[idx]
-
-    return (
-        og_scores,
-        aave_scores,
-        nigerianD_scores,
-        indianD_scores,
-        singlish_scores,
-        to_drop,
-    )
-
-
-def split_tox_nontox(hatexplain_df, to_drop, scores):
-    """Split the scores into toxic and non-toxic based on gold labels
-    Input: scores of original or dialect text data (all instances)
-    Return: tuple of two lists (scores of gold toxic instances, scores of gold non-toxic instances)
-    """
-    gold_labels = []
-    for i in range(len(hatexplain_df)):
-        annotations = [an["label"] for an in hatexplain_df["annotators"].iloc[i]]
-        # if less than two annotators labeled current sentence as normal, consider it toxic
-        if annotations.count("normal") < 2:
-            gold_labels.append(1)
-        else:
-            gold_labels.append(0)
-
-    # drop error indices by Perspective also from gold labels
-    for idx in to_drop:
-        del gold_labels[idx]
+from alignScores import load_aligned_scores
+from goldLabels import load_gold_index, rule_suffix, DEFAULT_RULE, RULES
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR
 
-    # given gold toxic labels, check how Perspective API scores the sentences
-    gtox_scores = []
-    # given gold non-toxic labels, check how Perspective API scores the sentences
-    gntox_scores = []
-
-    for i in range(len(gold_labels)):
-        if gold_labels[i] == 1:
-            gtox_scores.append(scores[i])
-        else:
-            gntox_scores.append(scores[i])
-
-    score_splits = (gtox_scores, gntox_scores)
-
-    return score_splits
+PLOT_WORKERS = min(4, os.cpu_count() or 1)  # one figure per dialect
 
 
 def print_tox_increase_count(og_splits, dialect_splits, dialect_name):
@@ -158,7 +70,7 @@ def print_tox_increase_count(og_splits, dialect_splits, dialect_name):
 
 
 def save_all_score_plots(
-    og_splits, aave_splits, nigerianD_splits, indianD_splits, singlish_splits
+    og_splits, aave_splits, nigerianD_splits, indianD_splits, singlish_splits, suffix=""
 ):
     """Save boxplots of all scores across original and dialects
     The scores are split into two subplots based on gold labels"""
@@ -215,15 +127,49 @@ def save_all_score_plots(
     plt.title("Perspective scores of gold toxic texts")
 
     # save plot for overviewing all scores across original and dialects
-    plt.savefig("../outputs/all-scores.png", bbox_inches="tight")
+    plt.savefig(f"../outputs/all-scores{suffix}.png", bbox_inches="tight")
 
     return True
 
 
-def save_score_change_plots(og_splits, dialect_splits, dialect_name):
+def change_lines(og_scores, dialect_scores, rasterized=False):
+    """Lines from the original to the dialect score of the instances inside both interquartile bands
+    Increases are darkorange, decreases lightblue, all lines are one LineCollection"""
+    og_scores = np.asarray(og_scores)
+    dialect_scores = np.asarray(dialect_scores)
+
+    # calculate quartiles for each set of scores
+    q1_og, q3_og = np.percentile(og_scores, [25, 75])
+    q1_dialect, q3_dialect = np.percentile(dialect_scores, [25, 75])
+    inside = (
+        (q1_og <= og_scores)
+        & (og_scores <= q3_og)
+        & (q1_dialect <= dialect_scores)
+        & (dialect_scores <= q3_dialect)
+    )
+    og_scores = og_scores[inside]
+    dialect_scores = dialect_scores[inside]
+
+    # one segment per instance: (1, og score) -> (2, dialect score)
+    segments = np.zeros((len(og_scores), 2, 2))
+    segments[:, 0, 0] = 1
+    segments[:, 1, 0] = 2
+    segments[:, 0, 1] = og_scores
+    segments[:, 1, 1] = dialect_scores
+    colors = np.where(og_scores > dialect_scores, "lightblue", "darkorange")
+
+    return LineCollection(
+        segments, colors=colors, linestyle="-", linewidths=1, rasterized=rasterized
+    )
+
+
+def save_score_change_plots(
+    og_splits, dialect_splits, dialect_name, suffix="", rasterized=False, verbose=True
+):
     """Calculate quartiles for each set of scores and create boxplots
     Colored Lines indicate score changes for each instance
-    The scores are split into two subplots based on gold labels"""
+    The scores are split into two subplots based on gold labels
+    rasterized: draw the lines as an image in vector outputs (pdf, svg)"""
     gtox_og_scores = og_splits[0]
     gtox_dialect_scores = dialect_splits[0]
     gntox_og_scores = og_splits[1]
@@ -233,12 +179,6 @@ def save_score_change_plots(og_splits, dialect_splits, dialect_name):
     fig, ax = plt.subplots(
         ncols=2, figsize=(15, 10)
     )  # adjust the first value to increase the width
-    # calculate quartiles for each set of scores
-    q1_gntox_og, q3_gntox_og = np.percentile(gntox_og_scores, [25, 75])
-    q1_gntox_dialect, q3_gntox_dialect = np.percentile(gntox_dialect_scores, [25, 75])
-
-    q1_gtox_og, q3_gtox_og = np.percentile(gtox_og_scores, [25, 75])
-    q1_gtox_dialect, q3_gtox_dialect = np.percentile(gtox_dialect_scores, [25, 75])
 
     # create boxplots and lines for original scores and dialect scores
     ax[0].boxplot(
@@ -247,22 +187,9 @@ def save_score_change_plots(og_splits, dialect_splits, dialect_name):
         widths=0.6,
         medianprops={"color": "slategrey"},
     )
-    for i in range(len(gntox_og_scores)):
-        if (
-            q1_gntox_og <= gntox_og_scores[i] <= q3_gntox_og
-            and q1_gntox_dialect <= gntox_dialect_scores[i] <= q3_gntox_dialect
-        ):
-            if gntox_og_scores[i] > gntox_dialect_scores[i]:
-                color = "lightblue"
-            else:
-                color = "darkorange"
-            ax[0].plot(
-                [1, 2],
-                [gntox_og_scores[i], gntox_dialect_scores[i]],
-                color=color,
-                linestyle="-",
-                linewidth=1,
-            )
+    ax[0].add_collection(
+        change_lines(gntox_og_scores, gntox_dialect_scores, rasterized)
+    )
     ax[0].set_xticks([1, 2])
     ax[0].set_xticklabels(["Original", f"{dialect_name} (converted)"])
     ax[0].set_title("Perspective scores of gold non-toxic texts")
@@ -274,34 +201,59 @@ def save_score_change_plots(og_splits, dialect_splits, dialect_name):
         widths=0.6,
         medianprops={"color": "slategrey"},
     )
-    for i in range(len(gtox_og_scores)):
-        if (
-            q1_gtox_og <= gtox_og_scores[i] <= q3_gtox_og
-            and q1_gtox_dialect <= gtox_dialect_scores[i] <= q3_gtox_dialect
-        ):
-            if gtox_og_scores[i] > gtox_dialect_scores[i]:
-                color = "lightblue"
-            else:
-                color = "darkorange"
-            ax[1].plot(
-                [1, 2],
-                [gtox_og_scores[i], gtox_dialect_scores[i]],
-                color=color,
-                linestyle="-",
-                linewidth=1,
-            )
+    ax[1].add_collection(change_lines(gtox_og_scores, gtox_dialect_scores, rasterized))
     ax[1].set_xticks([1, 2])
     ax[1].set_xticklabels(["Original", f"{dialect_name} (converted)"])
     ax[1].set_title("Perspective scores of gold toxic texts")
 
     # save the plot to the figures folder
-    plt.savefig(f"../outputs/{dialect_name}-changes.png", bbox_inches="tight")
-    print(f"|-- {dialect_name} done!")
+    plt.savefig(f"../outputs/{dialect_name}-changes{suffix}.png", bbox_inches="tight")
+    plt.close(fig)
+    if verbose:
+        print(f"|-- {dialect_name} done!")
 
     return True
 
 
-def save_inc_dec_percentages_plot(inc_percentages):
+def init_plot_worker():
+    # workers only write files, no display needed; figures inherited from the parent are dropped
+    plt.close("all")
+    plt.switch_backend("Agg")
+
+
+def save_change_plot_task(task):
+    og_splits, dialect_splits, dialect_name, suffix, rasterized = task
+    return save_score_change_plots(
+        og_splits, dialect_splits, dialect_name, suffix, rasterized, verbose=False
+    )
+
+
+def save_all_change_plots(
+    og_splits, dialect_splits, suffix="", rasterized=False, workers=PLOT_WORKERS
+):
+    """Save the score change plots of all dialects, rendered in parallel processes
+    Input: {dialect name: splits}"""
+    if workers <= 1:
+        for dialect_name, splits in dialect_splits.items():
+            save_score_change_plots(og_splits, splits, dialect_name, suffix, rasterized)
+        return True
+
+    tasks = [
+        (og_splits, splits, dialect_name, suffix, rasterized)
+        for dialect_name, splits in dialect_splits.items()
+    ]
+    with ProcessPoolExecutor(
+        min(workers, len(tasks)), initializer=init_plot_worker
+    ) as executor:
+        for dialect_name, _ in zip(
+            dialect_splits, executor.map(save_change_plot_task, tasks)
+        ):
+            print(f"|-- {dialect_name} done!")
+
+    return True
+
+
+def save_inc_dec_percentages_plot(inc_percentages, suffix=""):
     """Collect how many percentages of instances suffer from toxicty score increase in dialect set
     Save the percentile comparisons to output"""
     colors = ["lightblue", "darkorange"] * 4
@@ -337,39 +289,65 @@ def save_inc_dec_percentages_plot(inc_percentages):
     plt.legend(handles=legend_handles, loc="upper right")
 
     # save the plot to the figures folder
-    plt.savefig(f"../outputs/score-increase-percentages.png", bbox_inches="tight")
+    plt.savefig(
+        f"../outputs/score-increase-percentages{suffix}.png", bbox_inches="tight"
+    )
 
     return True
 
 
 if __name__ == "__main__":
-    # original HateXplain dataset with gold annotation labels
-    hatexplain_df = pd.read_json(f"../data/hatexplain_original.json").transpose()
-
-    og1, aave1, nigerianD1, indianD1, singlish1, to_drop1 = process_batch("batch1")
-    og2, aave2, nigerianD2, indianD2, singlish2, to_drop2 = process_batch("batch2")
-    og3, aave3, nigerianD3, indianD3, singlish3, to_drop3 = process_batch("batch3")
-    og4, aave4, nigerianD4, indianD4, singlish4, to_drop4 = process_batch("batch4")
-
-    og_scores = og1 + og2 + og3 + og4
-    aave_scores = aave1 + aave2 + aave3 + aave4
-    nigerianD_scores = nigerianD1 + nigerianD2 + nigerianD3 + nigerianD4
-    indianD_scores = indianD1 + indianD2 + indianD3 + indianD4
-    singlish_scores = singlish1 + singlish2 + singlish3 + singlish4
-
-    # collect all error indexes by adding the offset
-    to_drop2 = [i + 5000 for i in to_drop2]
-    to_drop3 = [i + 10000 for i in to_drop3]
-    to_drop4 = [i + 15000 for i in to_drop4]
-    to_drop = sorted(to_drop1 + to_drop2 + to_drop3 + to_drop4, reverse=True)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--attribute",
+        default=DEFAULT_ATTRIBUTE,
+        help="Perspective attribute to analyse, e.g. TOXICITY, INSULT (default: TOXICITY)",
+    )
+    parser.add_argument(
+        "--scores-dir",
+        default=SCORES_DIR,
+        help="directory of the score and error files, e.g. ../scores_linear",
+    )
+    parser.add_argument(
+        "--gold-rule",
+        default=DEFAULT_RULE,
+        choices=RULES,
+        help="how the annotator labels are aggregated to gold labels (default: fewer_than_2_normal)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=PLOT_WORKERS,
+        help="processes rendering the score change plots (default: up to 4)",
+    )
+    parser.add_argument(
+        "--rasterize",
+        action="store_true",
+        help="rasterize the per-instance lines of the score change plots",
+    )
+    args = parser.parse_args()
+
+    suffix = output_suffix(args.attribute, args.scores_dir) + rule_suffix(
+        args.gold_rule
+    )
+    # gold labels of the original HateXplain dataset
+    gold = load_gold_index()
+
+    # scores of all variants, aligned over the instances scored in every variant
+    aligned, valid = load_aligned_scores(args.scores_dir, args.attribute)
+    og_scores = aligned["original"].tolist()
+    aave_scores = aligned["aave"].tolist()
+    nigerianD_scores = aligned["nigerianD"].tolist()
+    indianD_scores = aligned["indianD"].tolist()
+    singlish_scores = aligned["singlish"].tolist()
 
     # split scores og text data according to gold labels, as base standard
-    og_splits = split_tox_nontox(hatexplain_df, to_drop, og_scores)
+    og_splits = gold.split(og_scores, valid, args.gold_rule)
     # do the same for dialects, these are to be compared to the original scores
-    aave_splits = split_tox_nontox(hatexplain_df, to_drop, aave_scores)
-    nigerianD_splits = split_tox_nontox(hatexplain_df, to_drop, nigerianD_scores)
-    indianD_splits = split_tox_nontox(hatexplain_df, to_drop, indianD_scores)
-    singlish_splits = split_tox_nontox(hatexplain_df, to_drop, singlish_scores)
+    aave_splits = gold.split(aave_scores, valid, args.gold_rule)
+    nigerianD_splits = gold.split(nigerianD_scores, valid, args.gold_rule)
+    indianD_splits = gold.split(indianD_scores, valid, args.gold_rule)
+    singlish_splits = gold.split(singlish_scores, valid, args.gold_rule)
 
     # print out the count of instances where the dialect scores are higher than the original scores
     aave_gntox_incp, aave_gtox_incp = print_tox_increase_count(
@@ -392,16 +370,29 @@ if __name__ == "__main__":
         flush=True,
     )
     save_all_score_plots(
-        og_splits, aave_splits, nigerianD_splits, indianD_splits, singlish_splits
+        og_splits,
+        aave_splits,
+        nigerianD_splits,
+        indianD_splits,
+        singlish_splits,
+        suffix,
     )
     print(" done!")
 
     # save boxplots of score changes of each instance for each dialect
     print("Saving OG scores vs. dialect scores comparison plots ...")
-    save_score_change_plots(og_splits, aave_splits, "AAVE")
-    save_score_change_plots(og_splits, nigerianD_splits, "NigerianD")
-    save_score_change_plots(og_splits, indianD_splits, "IndianD")
-    save_score_change_plots(og_splits, singlish_splits, "Singlish")
+    save_all_change_plots(
+        og_splits,
+        {
+            "AAVE": aave_splits,
+            "NigerianD": nigerianD_splits,
+            "IndianD": indianD_splits,
+            "Singlish": singlish_splits,
+        },
+        suffix,
+        args.rasterize,
+        args.workers,
+    )
 
     # save score increase percentile plots
     print(
@@ -419,5 +410,5 @@ if __name__ == "__main__":
         singlsih_gntox_incp * 100,
         singlish_gtox_incp * 100,
     ]
-    save_inc_dec_percentages_plot(inc_percentages)
+    save_inc_dec_percentages_plot(inc_percentages, suffix)
     print(" done!")
@@ -0,0 +1,162 @@
+"""Gold-label index of the HateXplain dataset, computed once and persisted next to the data
+
+The annotator labels of all posts are kept as an int8 matrix (posts x annotators, see LABELS,
+-1 for a missing annotator) and turned into binary gold labels under several aggregation rules:
+    - fewer_than_2_normal: toxic if less than two annotators labeled the post as normal
+      (the rule of all analyses so far)
+    - majority: the label given by more than half of the annotators, toxic if it is offensive
+      or hatespeech, undecided (-1) if no label has a majority
+    - unanimous: toxic or non-toxic if all annotators agree on it, undecided (-1) otherwise
+Undecided posts belong to neither side of a split
+
+The index is saved to ../data/hatexplain_original.gold.npz and rebuilt when the dataset changes
+
+Usage:
+    $ python goldLabels.py [--data ../data/hatexplain_original.json]
+
+    from goldLabels import load_gold_index
+    gold = load_gold_index()
+    gtox_scores, gntox_scores = gold.split(scores, valid)  # scores aligned over the valid instances
+"""
+
+import os
+import argparse
+
+import numpy as np
+
+from loadHateXplain import load_hatexplain, HATEXPLAIN_PATH
+
+LABELS = ["normal", "offensive", "hatespeech"]  # codes 0, 1, 2 of the annotator matrix
+RULES = ["fewer_than_2_normal", "majority", "unanimous"]
+DEFAULT_RULE = "fewer_than_2_normal"
+
+
+def gold_index_path(data_path=HATEXPLAIN_PATH):
+    return f"{os.path.splitext(data_path)[0]}.gold.npz"
+
+
+def rule_suffix(rule):
+    """Suffix for output file names, empty for the default rule to keep the original names"""
+    return "" if rule == DEFAULT_RULE else f"-{rule}"
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return np.array([stat.st_size, stat.st_mtime_ns], dtype=np.int64)
+
+
+def annotator_matrix(hatexplain_df):
+    """int8 matrix of the annotator labels, posts x annotators, -1 for a missing annotator"""
+    codes = {label: code for code, label in enumerate(LABELS)}
+    n_annotators = max(len(annotators) for annotators in hatexplain_df["annotators"])
+
+    matrix = np.full((len(hatexplain_df), n_annotators), -1, dtype=np.int8)
+    for i, annotators in enumerate(hatexplain_df["annotators"]):
+        matrix[i, : len(annotators)] = [codes[an["label"]] for an in annotators]
+    return matrix
+
+
+def aggregate_labels(matrix):
+    """Binary gold labels of all rules, 1 toxic, 0 non-toxic, -1 undecided
+    Return: dict {rule: int8 array over the posts}"""
+    # votes per label: posts x labels
+    counts = np.stack([(matrix == code).sum(axis=1) for code in range(len(LABELS))], 1)
+    n_annotators = counts.sum(axis=1)
+    n_normal = counts[:, 0]
+
+    majority = np.full(len(matrix), -1, dtype=np.int8)
+    has_majority = counts.max(axis=1) * 2 > n_annotators
+    majority[has_majority] = counts[has_majority].argmax(axis=1) != 0
+
+    unanimous = np.full(len(matrix), -1, dtype=np.int8)
+    unanimous[n_normal == n_annotators] = 0
+    unanimous[n_normal == 0] = 1
+
+    return {
+        "fewer_than_2_normal": (n_normal < 2).astype(np.int8),
+        "majority": majority,
+        "unanimous": unanimous,
+    }
+
+
+class GoldLabelIndex:
+    """Annotator matrix and gold labels of all rules, in dataset order"""
+
+    def __init__(self, post_ids, matrix, labels):
+        self.post_ids = post_ids
+        self.matrix = matrix
+        self._labels = labels
+
+    def labels(self, rule=DEFAULT_RULE):
+        """Gold labels of all posts under one aggregation rule"""
+        if rule not in self._labels:
+            raise ValueError(f"Unknown aggregation rule {rule}, choose from {RULES}")
+        return self._labels[rule]
+
+    def split(self, scores, valid=None, rule=DEFAULT_RULE):
+        """Split the scores into toxic and non-toxic based on gold labels
+        Input: scores of all posts, or aligned scores of the posts in the validity mask
+        Return: tuple of two lists (scores of gold toxic instances, scores of gold non-toxic instances)
+        """
+        labels = self.labels(rule)
+        if valid is not None:
+            labels = labels[valid]
+        scores = np.asarray(scores)
+        return scores[labels == 1].tolist(), scores[labels == 0].tolist()
+
+    def save(self, path, fingerprint):
+        np.savez(
+            path,
+            post_ids=self.post_ids,
+            matrix=self.matrix,
+            fingerprint=fingerprint,
+            **{f"labels_{rule}": labels for rule, labels in self._labels.items()},
+        )
+
+
+def build_gold_index(hatexplain_df):
+    matrix = annotator_matrix(hatexplain_df)
+    post_ids = np.asarray(hatexplain_df.index, dtype=str)
+    return GoldLabelIndex(post_ids, matrix, aggregate_labels(matrix))
+
+
+def load_gold_index(data_path=HATEXPLAIN_PATH, hatexplain_df=None):
+    """Load the persisted gold-label index, build and save it first if it is missing or stale
+    Input: optionally the already read dataset, to not read it again for a rebuild"""
+    path = gold_index_path(data_path)
+    fingerprint = file_fingerprint(data_path)
+    if os.path.exists(path):
+        with np.load(path) as saved:
+            if np.array_equal(saved["fingerprint"], fingerprint) and all(
+                f"labels_{rule}" in saved for rule in RULES
+            ):
+                return GoldLabelIndex(
+                    saved["post_ids"],
+                    saved["matrix"],
+                    {rule: saved[f"labels_{rule}"] for rule in RULES},
+                )
+
+    if hatexplain_df is None:
+        hatexplain_df = load_hatexplain(["annotators"], data_path)
+    gold = build_gold_index(hatexplain_df)
+    gold.save(path, fingerprint)
+    return gold
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--data", default=HATEXPLAIN_PATH)
+    args = parser.parse_args()
+
+    hatexplain_df = load_hatexplain(["annotators"], args.data)
+    gold = build_gold_index(hatexplain_df)
+    gold.save(gold_index_path(args.data), file_fingerprint(args.data))
+
+    print(f"{len(gold.post_ids)} posts, {gold.matrix.shape[1]} annotators per post")
+    for rule in RULES:
+        labels = gold.labels(rule)
+        print(
+            f"{rule:20} toxic: {(labels == 1).sum():6}  non-toxic: {(labels == 0).sum():6}"
+            f"  undecided: {(labels == -1).sum():6}"
+        )
+    print(f"Saved to {gold_index_path(args.data)}")
@@ -0,0 +1,79 @@
+"""Local CPU scorer backend: a linear toxicity model trained on the HateXplain gold labels
+
+Texts are turned into hashed, tf-idf weighted word uni- and bigrams (sparse, no vocabulary
+to fit) and scored by logistic regression models in one sparse matrix product per batch
+The gold data is split into K folds with one model per fold left out, and every instance
+is scored by the model that did not see it (cross-fitting), so the original texts are not
+scored in-sample while their dialect versions are
+
+Used by retrievePerspectiveScores.py with --backend linear, it only provides TOXICITY
+"""
+
+import numpy as np
+from sklearn.feature_extraction.text import HashingVectorizer, TfidfTransformer
+from sklearn.linear_model import LogisticRegression
+
+
+class LinearScorerBackend:
+    """Scorer backend with the interface of PerspectiveBackend in retrievePerspectiveScores.py"""
+
+    name = "linear"
+    journaled = False  # scoring a batch takes a fraction of a second
+    attributes = ["TOXICITY"]
+
+    def __init__(self, texts, gold_labels, n_folds=5, seed=0):
+        self.vectorizer = HashingVectorizer(
+            ngram_range=(1, 2), n_features=2**20, alternate_sign=False, norm=None
+        )
+        self.tfidf = TfidfTransformer(sublinear_tf=True)
+        features = self.tfidf.fit_transform(self.vectorizer.transform(texts))
+        labels = np.asarray(gold_labels)
+
+        # fold of every training instance, the instance is scored by the model without this fold
+        self.folds = np.random.default_rng(seed).integers(0, n_folds, len(labels))
+        models = [
+            LogisticRegression(C=4.0, solver="liblinear").fit(
+                features[self.folds != k], labels[self.folds != k]
+            )
+            for k in range(n_folds)
+        ]
+        # stack the weights of all fold models to score all of them in one product
+        self.coef = np.vstack([model.coef_[0] for model in models]).T
+        self.intercept = np.array([model.intercept_[0] for model in models])
+
+    def predict(self, texts, instance_ids=None):
+        """Toxicity probabilities of a batch of texts
+        Instances with an id in the training data are scored by their held-out model,
+        all other texts by the average logit of all fold models"""
+        features = self.tfidf.transform(self.vectorizer.transform(texts))
+        logits = features @ self.coef + self.intercept  # texts x folds
+        if instance_ids is None:
+            logit = logits.mean(axis=1)
+        else:
+            ids = np.asarray(instance_ids)
+            logit = logits[np.arange(len(ids)), self.folds[ids]]
+        return 1 / (1 + np.exp(-logit))
+
+    def score_texts(
+        self,
+        texts,
+        attributes=("TOXICITY",),
+        journal=None,
+        instance_ids=None,
+        on_score=None,
+    ):
+        """Score a list of texts
+        Return: tuple ({attribute: score} of all texts in input order, indices of failed texts)
+        """
+        unsupported = sorted(set(attributes) - set(self.attributes))
+        if unsupported:
+            raise ValueError(f"The linear backend cannot score {unsupported}")
+
+        scores = [
+            {"TOXICITY": float(score)} for score in self.predict(texts, instance_ids)
+        ]
+        if on_score is not None:
+            for i, text_scores in enumerate(scores):
+                on_score(i, text_scores)
+
+        return scores, []
@@ -0,0 +1,235 @@
+"""Statistics of the scores updated while the scorer runs, without a pass over the score files
+
+The scorer feeds every score into the accumulators as soon as it arrives (also the scores
+taken from a journal on --resume); once the original and a dialect score of an instance are
+both known, the pair is added to the accumulators of its dialect and gold split:
+    - Welford running mean and variance of the differences (dialect - original, as the
+      mean_diff of pairedResampling.py and ruleAttribution.py), giving the paired t-statistic
+      of testScoreSignificance.py with the opposite sign (ttest_rel(og, dialect) tests og - dialect)
+    - count of dialect score > original score as in evaluateToxicityCap.py
+and every score is added to the gold x Perspective (>= 0.5) contingency counts of its variant
+as in checkPerspectiveReliability.py
+The accumulators cover every instance scored so far, the analysis scripts only the instances
+scored in all variants; the numbers agree once scoring is complete without errors
+
+A snapshot is written to ../outputs/live-stats.json every few seconds and at the end of
+every batch, the status view prints it
+
+Usage:
+    $ python retrievePerspectiveScores.py --live-stats
+    in another terminal, show the snapshot every 5 seconds:
+    $ python liveStats.py [--attribute TOXICITY] [--scores-dir ../scores] [--interval 5]
+"""
+
+import os
+import json
+import time
+import argparse
+
+import numpy as np
+
+from scipy.stats import t as t_distribution
+
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR, VARIANTS
+from thresholdSweep import chi_square
+
+THRESHOLD = 0.5
+SPLITS = {1: "gtox", 0: "gntox"}
+
+
+def finite(x):
+    """x as a float, None if undefined (json has no NaN)"""
+    return None if x is None or np.isnan(x) else float(x)
+
+
+def live_stats_path(attribute=DEFAULT_ATTRIBUTE, scores_dir=SCORES_DIR):
+    return f"../outputs/live-stats{output_suffix(attribute, scores_dir)}.json"
+
+
+class Welford:
+    """Running count, mean and variance of a stream of numbers"""
+
+    def __init__(self):
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0  # sum of squared deviations from the mean
+
+    def update(self, x):
+        self.n += 1
+        delta = x - self.mean
+        self.mean += delta / self.n
+        self.m2 += delta * (x - self.mean)
+
+    def variance(self):
+        """Sample variance (ddof=1), NaN below two values"""
+        return self.m2 / (self.n - 1) if self.n > 1 else float("nan")
+
+    def t_test(self):
+        """One-sample t-test of mean 0, i.e. the paired t-test of the differences
+        Return: tuple (t-statistic, two-sided p-value)"""
+        if self.n < 2 or self.m2 == 0:
+            return float("nan"), float("nan")
+        t_statistic = self.mean / np.sqrt(self.variance() / self.n)
+        return t_statistic, 2 * t_distribution.sf(abs(t_statistic), self.n - 1)
+
+
+class LiveStats:
+    """Accumulators of all dialects and gold splits, fed one score at a time"""
+
+    def __init__(
+        self,
+        gold_labels,
+        attribute=DEFAULT_ATTRIBUTE,
+        path=None,
+        snapshot_interval=5.0,
+        variants=VARIANTS,
+    ):
+        self.gold_labels = np.asarray(gold_labels)
+        self.attribute = attribute
+        self.path = path
+        self.snapshot_interval = snapshot_interval
+        self.last_snapshot = time.monotonic()
+        self.variants = list(variants)
+        self.dialects = self.variants[1:]
+
+        # scores seen so far, to pair the original and dialect score of an instance
+        self.scores = {
+            variant: np.full(len(self.gold_labels), np.nan) for variant in self.variants
+        }
+        self.diffs = {
+            (dialect, split): Welford()
+            for dialect in self.dialects
+            for split in SPLITS.values()
+        }
+        self.increases = {key: 0 for key in self.diffs}
+        # gold (toxic, non-toxic) x Perspective (toxic, non-toxic)
+        self.contingency = {variant: np.zeros((2, 2), int) for variant in self.variants}
+
+    def record(self, variant, instance_id, text_scores):
+        """Add the scores {attribute: score} of one instance of a variant"""
+        score = text_scores[self.attribute]
+        if not np.isnan(self.scores[variant][instance_id]):
+            return  # scored again (e.g. a retried request), already counted
+        self.scores[variant][instance_id] = score
+
+        gold = self.gold_labels[instance_id]
+        if gold == -1:
+            return  # undecided gold label, left out of all splits
+        self.contingency[variant][1 - gold, 0 if score >= THRESHOLD else 1] += 1
+
+        if variant == self.variants[0]:
+            pairs = [
+                (dialect, score, self.scores[dialect][instance_id])
+                for dialect in self.dialects
+            ]
+        else:
+            pairs = [(variant, self.scores[self.variants[0]][instance_id], score)]
+        for dialect, og_score, dialect_score in pairs:
+            if np.isnan(og_score) or np.isnan(dialect_score):
+                continue
+            key = (dialect, SPLITS[gold])
+            self.diffs[key].update(dialect_score - og_score)
+            self.increases[key] += og_score < dialect_score
+
+        if (
+            self.path
+            and time.monotonic() - self.last_snapshot >= self.snapshot_interval
+        ):
+            self.save_snapshot()
+
+    def listener(self, variant, offset=0):
+        """Callback (index in batch, {attribute: score}) for the scorer backends"""
+        return lambda i, text_scores: self.record(variant, offset + i, text_scores)
+
+    def snapshot(self):
+        """Current statistics as a json-serializable dict"""
+        pairs = {}
+        for (dialect, split), welford in self.diffs.items():
+            t_statistic, p_value = welford.t_test()
+            pairs.setdefault(dialect, {})[split] = {
+                "n": welford.n,
+                "mean_diff": finite(welford.mean) if welford.n else None,
+                "variance": finite(welford.variance()),
+                "t_statistic": finite(t_statistic),
+                "p_value": finite(p_value),
+                "increase_rate": (
+                    self.increases[(dialect, split)] / welford.n if welford.n else None
+                ),
+            }
+
+        contingency = {}
+        for variant, table in self.contingency.items():
+            (tp, fn), (fp, tn) = table
+            chi2, p_value = chi_square(*[np.array([c]) for c in (tp, fp, fn, tn)])
+            contingency[variant] = {
+                "gold_toxic": {"toxic": int(tp), "non_toxic": int(fn)},
+                "gold_non_toxic": {"toxic": int(fp), "non_toxic": int(tn)},
+                "chi2": finite(chi2[0]),
+                "p_value": finite(p_value[0]),
+            }
+
+        return {
+            "attribute": self.attribute,
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "scored": {
+                variant: int((~np.isnan(scores)).sum())
+                for variant, scores in self.scores.items()
+            },
+            "pairs": pairs,
+            "contingency": contingency,
+        }
+
+    def save_snapshot(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # write to a temporary file first, so the status view never reads a half-written snapshot
+        with open(self.path + ".tmp", "w") as f:
+            json.dump(self.snapshot(), f, indent=4)
+        os.replace(self.path + ".tmp", self.path)
+        self.last_snapshot = time.monotonic()
+
+
+def format_status(snapshot):
+    """Table of the running statistics of a snapshot"""
+    lines = [
+        f"{snapshot['attribute']} at {snapshot['time']}, scored: "
+        + ", ".join(f"{v} {n}" for v, n in snapshot["scored"].items()),
+        f"{'dialect':<10} {'split':<6} {'pairs':>6} {'mean diff':>10} "
+        f"{'t-statistic':>12} {'p-value':>10} {'dialect>og':>10}",
+    ]
+    for dialect, splits in snapshot["pairs"].items():
+        for split, stats in splits.items():
+            values = [stats["mean_diff"], stats["t_statistic"], stats["p_value"]]
+            values = ["-" if v is None else f"{v:.4g}" for v in values]
+            rate = stats["increase_rate"]
+            lines.append(
+                f"{dialect:<10} {split:<6} {stats['n']:>6} {values[0]:>10} "
+                f"{values[1]:>12} {values[2]:>10} "
+                f"{'-' if rate is None else round(rate, 4):>10}"
+            )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--attribute", default=DEFAULT_ATTRIBUTE)
+    parser.add_argument("--scores-dir", default=SCORES_DIR)
+    parser.add_argument(
+        "--interval", type=float, default=5.0, help="seconds between updates"
+    )
+    parser.add_argument(
+        "--once", action="store_true", help="show the snapshot once and exit"
+    )
+    args = parser.parse_args()
+
+    path = live_stats_path(args.attribute, args.scores_dir)
+    while True:
+        if os.path.exists(path):
+            with open(path) as f:
+                status = format_status(json.load(f))
+        else:
+            status = f"No snapshot at {path} yet, start the scorer with --live-stats"
+        if args.once:
+            print(status)
+            break
+        print("\033[2J\033[H" + status, flush=True)  # clear the terminal
+        time.sleep(args.interval)
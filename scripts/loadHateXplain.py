@@ -0,0 +1,144 @@
+"""Fast loader for the HateXplain dataset with a binary cache of the requested fields
+
+The dataset json is one object {post_id: {"post_id", "annotators", "rationales", "post_tokens"}}
+Instead of pd.read_json(...).transpose(), which builds an object DataFrame of all fields,
+the file is read in chunks and decoded post by post, keeping only the requested fields
+Every field is cached as a pickle in ../cache/hatexplain/, under the sha256 of the dataset,
+so later runs only hash the file and unpickle the fields they need
+
+Usage:
+    from loadHateXplain import load_hatexplain
+    hatexplain_df = load_hatexplain(["post_tokens"])  # indexed by post id, as read_json().transpose()
+"""
+
+import os
+import json
+import pickle
+import hashlib
+
+import pandas as pd
+
+HATEXPLAIN_PATH = "../data/hatexplain_original.json"
+HATEXPLAIN_CACHE = "../cache/hatexplain"
+DEFAULT_FIELDS = ("post_tokens", "annotators")
+INDEX_FIELD = "post_id"  # keys of the top-level object, cached with every dataset
+
+
+def file_hash(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def iter_posts(path, chunk_size=1 << 20):
+    """Decode the top-level object of a json file one (key, value) pair at a time
+    Only one post and one chunk of the file are held in memory"""
+    decoder = json.JSONDecoder()
+    with open(path, encoding="utf-8") as f:
+        buffer = ""
+        pos = 0
+        eof = False
+
+        def fill():
+            # drop the consumed part and append the next chunk, False at the end of the file
+            nonlocal buffer, pos, eof
+            chunk = f.read(chunk_size)
+            eof = not chunk
+            buffer = buffer[pos:] + chunk
+            pos = 0
+            return not eof
+
+        def next_char():
+            # position of the next non-whitespace character
+            nonlocal pos
+            while True:
+                while pos < len(buffer) and buffer[pos].isspace():
+                    pos += 1
+                if pos < len(buffer) or not fill():
+                    return buffer[pos] if pos < len(buffer) else ""
+
+        def decode():
+            nonlocal pos
+            while True:
+                try:
+                    value, end = decoder.raw_decode(buffer, pos)
+                    # a number at the end of the buffer could continue in the next chunk
+                    if end < len(buffer) or eof:
+                        pos = end
+                        return value
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                fill()
+
+        if next_char() != "{":
+            raise ValueError(f"{path} is not a json object")
+        pos += 1
+        if next_char() == "}":
+            return
+
+        while True:
+            key = decode()
+            if next_char() != ":":
+                raise ValueError(f"Expected ':' after key {key!r} in {path}")
+            pos += 1
+            next_char()
+            yield key, decode()
+
+            separator = next_char()
+            pos += 1
+            if separator == "}":
+                return
+            if separator != ",":
+                raise ValueError(f"Expected ',' or '}}' after post {key!r} in {path}")
+            next_char()
+
+
+def field_cache_path(cache_dir, digest, field):
+    return f"{cache_dir}/{digest[:16]}/{field}.pkl"
+
+
+def parse_fields(path, fields):
+    """Read the requested fields of all posts in one streaming pass
+    Return: dict {field: list of values in file order}, including the post ids"""
+    columns = {field: [] for field in [INDEX_FIELD, *fields]}
+    for post_id, post in iter_posts(path):
+        columns[INDEX_FIELD].append(post_id)
+        for field in fields:
+            columns[field].append(post.get(field))
+    return columns
+
+
+def load_hatexplain(
+    fields=DEFAULT_FIELDS, path=HATEXPLAIN_PATH, cache_dir=HATEXPLAIN_CACHE
+):
+    """Load some fields of the HateXplain dataset, parse and cache the missing ones
+    Return: DataFrame indexed by post id with one column per field"""
+    digest = file_hash(path)
+    columns = {}
+    missing = []
+    for field in [INDEX_FIELD, *fields]:
+        cache_path = field_cache_path(cache_dir, digest, field)
+        if os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                columns[field] = pickle.load(f)
+        elif field != INDEX_FIELD:
+            missing.append(field)
+
+    if missing or INDEX_FIELD not in columns:
+        parsed = parse_fields(path, missing)
+        os.makedirs(
+            os.path.dirname(field_cache_path(cache_dir, digest, "")), exist_ok=True
+        )
+        for field, values in parsed.items():
+            # write to a temporary file first, so readers never see a half-written cache
+            cache_path = field_cache_path(cache_dir, digest, field)
+            with open(cache_path + ".tmp", "wb") as f:
+                pickle.dump(values, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(cache_path + ".tmp", cache_path)
+        columns.update(parsed)
+
+    post_ids = columns.pop(INDEX_FIELD)
+    return pd.DataFrame({field: columns[field] for field in fields}, index=post_ids)
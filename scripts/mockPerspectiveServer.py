@@ -0,0 +1,276 @@
+"""Local stand-in for the Perspective API (commentanalyzer v1alpha1) to test and tune the scorer offline
+
+Serves:
+    - GET  /$discovery/rest?version=v1alpha1: a minimal discovery document pointing to this server
+    - POST /v1alpha1/comments:analyze: deterministic scores (hash of text and attribute)
+    - POST /batch: batch HTTP requests (multipart/mixed) of analyze calls
+Every analyze call waits for the configured latency and can be rejected with a 429
+(random rate or a per-second quota) or fail with a 500 (random rate)
+
+Usage:
+    $ python mockPerspectiveServer.py [--port 8765] [--latency-ms 80] [--jitter-ms 20]
+        [--rate-429 0.01] [--error-rate 0.01] [--quota-qps 100]
+    then point the client to it:
+    PerspectiveClient("any-key", discovery_url=f"{server.url}/$discovery/rest?version=v1alpha1", discovery_cache=None)
+"""
+
+import json
+import time
+import random
+import hashlib
+import argparse
+import threading
+from collections import deque
+from email.parser import BytesParser
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+def mock_score(text, attribute):
+    """Deterministic score in [0, 1) of a text for one attribute"""
+    digest = hashlib.sha256(f"{attribute}\x1f{text}".encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big") / 2**64
+
+
+def discovery_document(root_url):
+    """Minimal discovery document with the comments.analyze method and batch support"""
+    return {
+        "kind": "discovery#restDescription",
+        "discoveryVersion": "v1",
+        "id": "commentanalyzer:v1alpha1",
+        "name": "commentanalyzer",
+        "version": "v1alpha1",
+        "protocol": "rest",
+        "rootUrl": root_url,
+        "servicePath": "",
+        "baseUrl": root_url,
+        "batchPath": "batch",
+        "parameters": {"key": {"type": "string", "location": "query"}},
+        "schemas": {
+            "AnalyzeCommentRequest": {"id": "AnalyzeCommentRequest", "type": "object"},
+            "AnalyzeCommentResponse": {
+                "id": "AnalyzeCommentResponse",
+                "type": "object",
+            },
+        },
+        "resources": {
+            "comments": {
+                "methods": {
+                    "analyze": {
+                        "id": "commentanalyzer.comments.analyze",
+                        "path": "v1alpha1/comments:analyze",
+                        "flatPath": "v1alpha1/comments:analyze",
+                        "httpMethod": "POST",
+                        "parameters": {},
+                        "parameterOrder": [],
+                        "request": {"$ref": "AnalyzeCommentRequest"},
+                        "response": {"$ref": "AnalyzeCommentResponse"},
+                    }
+                }
+            }
+        },
+    }
+
+
+class MockPerspectiveServer(ThreadingHTTPServer):
+    """Threaded HTTP server holding the fault injection settings and request counters"""
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        address=("127.0.0.1", 0),
+        latency_ms=80.0,
+        jitter_ms=20.0,
+        rate_429=0.0,
+        error_rate=0.0,
+        quota_qps=None,
+        seed=0,
+    ):
+        super().__init__(address, MockPerspectiveHandler)
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_429 = rate_429
+        self.error_rate = error_rate
+        self.quota_qps = quota_qps
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.call_times = deque()  # times of the analyze calls in the last second
+        self.reset_stats()
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {
+                "http_requests": 0,
+                "batch_requests": 0,
+                "analyze_calls": 0,
+                "rate_limited": 0,
+                "errors": 0,
+            }
+
+    def wait_latency(self):
+        with self.lock:
+            delay = max(0.0, self.rng.gauss(self.latency_ms, self.jitter_ms)) / 1000
+        time.sleep(delay)
+
+    def analyze(self, body):
+        """Answer one analyze call
+        Return: tuple (HTTP status, response body as dict)"""
+        with self.lock:
+            self.stats["analyze_calls"] += 1
+            now = time.monotonic()
+            while self.call_times and now - self.call_times[0] > 1.0:
+                self.call_times.popleft()
+            self.call_times.append(now)
+            quota = self.quota_qps if self.quota_qps is not None else float("inf")
+            if len(self.call_times) > quota or self.rng.random() < self.rate_429:
+                self.stats["rate_limited"] += 1
+                return 429, error_body(
+                    429, "Quota exceeded (mock)", "RESOURCE_EXHAUSTED"
+                )
+            if self.rng.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return 500, error_body(500, "Internal error (mock)", "INTERNAL")
+
+        try:
+            request = json.loads(body)
+            text = request["comment"]["text"]
+            attributes = list(request["requestedAttributes"])
+        except (ValueError, KeyError, TypeError):
+            return 400, error_body(400, "Invalid analyze request", "INVALID_ARGUMENT")
+
+        return 200, {
+            "attributeScores": {
+                attribute: {
+                    "summaryScore": {
+                        "value": mock_score(text, attribute),
+                        "type": "PROBABILITY",
+                    }
+                }
+                for attribute in attributes
+            },
+            "languages": ["en"],
+        }
+
+
+def error_body(code, message, status):
+    return {"error": {"code": code, "message": message, "status": status}}
+
+
+class MockPerspectiveHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, as the real API
+
+    def log_message(self, format, *args):
+        pass  # no log line per request
+
+    def send_json(self, status, payload):
+        content = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=UTF-8")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def read_body(self):
+        return self.rfile.read(int(self.headers.get("Content-Length", 0)))
+
+    def do_GET(self):
+        if self.path.startswith("/$discovery/rest"):
+            self.send_json(200, discovery_document(self.server.url + "/"))
+        else:
+            self.send_json(404, error_body(404, "Not found", "NOT_FOUND"))
+
+    def do_POST(self):
+        body = self.read_body()
+        with self.server.lock:
+            self.server.stats["http_requests"] += 1
+        path = self.path.split("?", 1)[0]
+
+        if path == "/v1alpha1/comments:analyze":
+            self.server.wait_latency()
+            self.send_json(*self.server.analyze(body))
+        elif path == "/batch":
+            with self.server.lock:
+                self.server.stats["batch_requests"] += 1
+            self.server.wait_latency()  # one round trip for the whole batch
+            self.send_batch_response(body)
+        else:
+            self.send_json(404, error_body(404, "Not found", "NOT_FOUND"))
+
+    def send_batch_response(self, body):
+        """Answer every analyze call of a multipart/mixed batch request in one response"""
+        header = f"Content-Type: {self.headers['Content-Type']}\r\n\r\n".encode()
+        message = BytesParser().parsebytes(header + body)
+        boundary = "batch_mock_boundary"
+
+        parts = []
+        for part in message.get_payload():
+            # each part holds a complete HTTP request: request line, headers, body
+            inner = part.get_payload()
+            inner_body = inner.replace("\r\n", "\n").split("\n\n", 1)[-1]
+            status, payload = self.server.analyze(inner_body.encode("utf-8"))
+            content_id = part["Content-ID"].strip("<>")
+            parts.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id}>\r\n\r\n"
+                f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\n"
+                "Content-Type: application/json; charset=UTF-8\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = ("".join(parts) + f"--{boundary}--\r\n").encode("utf-8")
+
+        self.send_response(200)
+        self.send_header("Content-Type", f"multipart/mixed; boundary={boundary}")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+
+def start_mock_server(**settings):
+    """Start a mock server on a free local port in a background thread"""
+    server = MockPerspectiveServer(**settings)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=80.0)
+    parser.add_argument("--jitter-ms", type=float, default=20.0)
+    parser.add_argument(
+        "--rate-429", type=float, default=0.0, help="share of calls rejected with 429"
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="share of calls failing with 500"
+    )
+    parser.add_argument(
+        "--quota-qps",
+        type=float,
+        default=None,
+        help="reject calls above this many per second with 429",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    server = MockPerspectiveServer(
+        (args.host, args.port),
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        error_rate=args.error_rate,
+        quota_qps=args.quota_qps,
+        seed=args.seed,
+    )
+    print(f"Mock Perspective API listening on {server.url}")
+    print(f"Discovery document: {server.url}/$discovery/rest?version=v1alpha1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(server.stats)
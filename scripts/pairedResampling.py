@@ -0,0 +1,148 @@
+"""Paired permutation and bootstrap tests of the score differences (dialect - original)
+
+The scores pile up near 0 and 1, so the paired t-test is complemented by tests that do not
+assume normal differences:
+    - sign-flip permutation test of the mean difference (two-sided)
+    - percentile bootstrap confidence interval of the mean difference
+    - effect sizes: mean and median difference, Cohen's d_z (mean / sd of the differences,
+      None if the differences do not vary)
+All dialects and gold splits are resampled in one pass: the differences form one
+pairs x (dialect, split) matrix that is zero outside the split of a column, and every chunk of
+resamples is a single matrix product of random signs or bootstrap counts with that matrix
+Chunks get their own seeds, the results do not depend on the number of workers
+
+Usage:
+    from pairedResampling import paired_resampling_tests
+    results = paired_resampling_tests(og_splits, {"AAVE": aave_splits, ...})
+    results["AAVE"]["gtox"]  # {"mean_diff": ..., "ci_low": ..., "permutation_p_value": ...}
+"""
+
+import numpy as np
+
+from concurrent.futures import ProcessPoolExecutor
+
+N_RESAMPLES = 10000
+CHUNK_SIZE = 250  # resamples per matrix product, bounds the memory of one chunk
+SEED = 42
+SPLITS = ("gtox", "gntox")  # order of the (toxic, non-toxic) gold splits
+
+_diffs = None  # difference matrix of a worker process
+_blocks = None
+
+
+def difference_matrix(og_splits, dialect_splits):
+    """Differences of all dialects and gold splits as one matrix
+    Input: original (toxic, non-toxic) scores and {dialect: (toxic, non-toxic) scores}
+    Return: tuple (pairs x columns matrix, zero outside the split of a column,
+    row range of every split, (dialect, split, row range) of every column)
+    """
+    blocks = []
+    start = 0
+    for og_scores in og_splits:
+        blocks.append((start, start + len(og_scores)))
+        start += len(og_scores)
+
+    columns = [
+        (dialect, split, blocks[i])
+        for dialect in dialect_splits
+        for i, split in enumerate(SPLITS)
+    ]
+    diffs = np.zeros((start, len(columns)))
+    for j, (dialect, split, (begin, end)) in enumerate(columns):
+        i = SPLITS.index(split)
+        diffs[begin:end, j] = np.asarray(dialect_splits[dialect][i]) - og_splits[i]
+
+    return diffs, blocks, columns
+
+
+def init_worker(diffs, blocks):
+    global _diffs, _blocks
+    _diffs, _blocks = diffs, blocks
+
+
+def resample_chunk(task):
+    """Sums of the differences of each column in a chunk of resamples
+    Input: ("permutation" or "bootstrap", number of resamples, seed)
+    Return: resamples x columns array"""
+    kind, size, seed = task
+    rng = np.random.default_rng(seed)
+    n_pairs = _diffs.shape[0]
+
+    if kind == "permutation":
+        # flipping the sign of a difference swaps original and dialect score of the pair
+        weights = rng.integers(0, 2, size=(size, n_pairs), dtype=np.int8) * 2 - 1
+    else:
+        # bootstrap: how often each pair is drawn, drawn within its own split
+        weights = np.zeros((size, n_pairs))
+        for begin, end in _blocks:
+            n = end - begin
+            draws = rng.integers(0, n, size=(size, n))
+            draws += np.arange(size)[:, None] * n
+            weights[:, begin:end] = np.bincount(
+                draws.ravel(), minlength=size * n
+            ).reshape(size, n)
+
+    return weights @ _diffs
+
+
+def resample_sums(diffs, blocks, kind, n_resamples, seed, workers=1):
+    """Column sums of n_resamples resamples, chunked and optionally on several processes"""
+    sizes = [CHUNK_SIZE] * (n_resamples // CHUNK_SIZE)
+    if n_resamples % CHUNK_SIZE:
+        sizes.append(n_resamples % CHUNK_SIZE)
+    seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+    tasks = [(kind, size, chunk_seed) for size, chunk_seed in zip(sizes, seeds)]
+
+    if workers > 1:
+        with ProcessPoolExecutor(
+            workers, initializer=init_worker, initargs=(diffs, blocks)
+        ) as executor:
+            return np.vstack(list(executor.map(resample_chunk, tasks)))
+
+    init_worker(diffs, blocks)
+    return np.vstack([resample_chunk(task) for task in tasks])
+
+
+def paired_resampling_tests(
+    og_splits,
+    dialect_splits,
+    n_resamples=N_RESAMPLES,
+    confidence=0.95,
+    workers=1,
+    seed=SEED,
+):
+    """Permutation test, bootstrap confidence interval and effect sizes of every dialect and split
+    Input: original (toxic, non-toxic) scores and {dialect: (toxic, non-toxic) scores}
+    Return: {dialect: {"gtox": {...}, "gntox": {...}}}
+    """
+    diffs, blocks, columns = difference_matrix(og_splits, dialect_splits)
+    n = np.array([end - begin for _, _, (begin, end) in columns])
+    observed = diffs.sum(axis=0) / n
+
+    permuted = resample_sums(diffs, blocks, "permutation", n_resamples, seed, workers)
+    # two-sided, the observed sample counts as one of the permutations
+    extreme = np.abs(permuted / n) >= np.abs(observed) - 1e-12
+    p_values = (extreme.sum(axis=0) + 1) / (n_resamples + 1)
+
+    bootstrap = resample_sums(
+        diffs, blocks, "bootstrap", n_resamples, seed + 1, workers
+    )
+    alpha = (1 - confidence) / 2
+    ci_low, ci_high = np.quantile(bootstrap / n, [alpha, 1 - alpha], axis=0)
+
+    results = {dialect: {} for dialect in dialect_splits}
+    for j, (dialect, split, (begin, end)) in enumerate(columns):
+        d = diffs[begin:end, j]
+        sd = d.std(ddof=1) if len(d) > 1 else 0.0
+        results[dialect][split] = {
+            "mean_diff": float(observed[j]),
+            "median_diff": float(np.median(d)),
+            "cohen_dz": float(observed[j] / sd) if sd > 0 else None,
+            "ci_low": float(ci_low[j]),
+            "ci_high": float(ci_high[j]),
+            "confidence": confidence,
+            "permutation_p_value": float(p_values[j]),
+            "n_resamples": n_resamples,
+        }
+
+    return results
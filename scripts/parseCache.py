@@ -0,0 +1,142 @@
+"""Shared spaCy parse cache for the multi-value dialect transforms (SQLite)
+
+Every multi-value dialect object runs its own spaCy pipeline (with neuralcoref) on each
+sentence, so the same sentence is parsed once per dialect. The pre-pass parses every
+distinct original sentence once and stores the serialized Doc; the dialect pipelines are
+then wrapped by CachedParser, which deserializes the cached Doc instead of parsing again
+Custom attributes (doc._.*) can not be serialized, the pipes that set them (neuralcoref)
+are left out of the pre-pass and run again on the deserialized Doc
+
+A cache entry is keyed by the hash of the pipeline (model name and version, pipe names)
+and the text, texts that are not cached are parsed as before
+
+Usage (next to convertTo4Dialects.py in the multi-value root directory):
+    from parseCache import ParseCache, parse_prepass, install_parse_cache
+    cache = ParseCache()
+    parse_prepass(sents, dialect.nlp, cache)
+    install_parse_cache(dialect, ParseCache(read_only=True))
+"""
+
+import os
+import sqlite3
+import hashlib
+
+from spacy.tokens import Doc
+from tqdm import tqdm
+
+PARSE_CACHE = "./parse_cache.sqlite"
+RERUN_PIPES = ("neuralcoref",)  # pipes setting custom attributes, run on every lookup
+
+
+def pipeline_version(nlp):
+    """Name, version and pipes of a spaCy pipeline, part of the cache key"""
+    return "{}-{}:{}".format(
+        nlp.meta.get("name"), nlp.meta.get("version"), ",".join(nlp.pipe_names)
+    )
+
+
+class ParseCache:
+    """Map (pipeline, text) to the serialized spaCy Doc"""
+
+    def __init__(self, path=PARSE_CACHE, read_only=False, commit_every=100):
+        if read_only:
+            # workers only read, the pre-pass in the main process writes;
+            # a read-only connection can be shared by the threads of the dialect server
+            self.conn = sqlite3.connect(
+                f"file:{path}?mode=ro", uri=True, check_same_thread=False
+            )
+        else:
+            if os.path.dirname(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+            self.conn = sqlite3.connect(path)
+            self.conn.execute("PRAGMA journal_mode=WAL")
+            self.conn.execute(
+                "CREATE TABLE IF NOT EXISTS parses (key TEXT PRIMARY KEY, doc BLOB NOT NULL)"
+            )
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, version, text):
+        payload = "\x1f".join([version, text])
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def contains(self, version, text):
+        row = self.conn.execute(
+            "SELECT 1 FROM parses WHERE key = ?", (self.key(version, text),)
+        ).fetchone()
+        return row is not None
+
+    def get(self, version, text):
+        """Return the serialized Doc of a text, or None if not cached"""
+        row = self.conn.execute(
+            "SELECT doc FROM parses WHERE key = ?", (self.key(version, text),)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0]
+
+    def put(self, version, text, doc_bytes):
+        self.conn.execute(
+            "INSERT OR REPLACE INTO parses (key, doc) VALUES (?, ?)",
+            (self.key(version, text), doc_bytes),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def close(self):
+        self.commit()
+        self.conn.close()
+
+
+class CachedParser:
+    """Drop-in for a spaCy pipeline that takes parses from the cache"""
+
+    def __init__(self, nlp, cache, rerun_pipes=RERUN_PIPES):
+        self.nlp = nlp
+        self.cache = cache
+        self.version = pipeline_version(nlp)
+        self.rerun_pipes = [name for name in rerun_pipes if name in nlp.pipe_names]
+
+    def __call__(self, text, *args, **kwargs):
+        doc_bytes = self.cache.get(self.version, text)
+        if doc_bytes is None:
+            return self.nlp(text, *args, **kwargs)
+
+        doc = Doc(self.nlp.vocab).from_bytes(doc_bytes)
+        for name in self.rerun_pipes:
+            doc = self.nlp.get_pipe(name)(doc)
+        return doc
+
+    def __getattr__(self, name):
+        # vocab, pipe_names, tokenizer, ... of the wrapped pipeline
+        return getattr(self.nlp, name)
+
+
+def parse_prepass(sents, nlp, cache, rerun_pipes=RERUN_PIPES, batch_size=256):
+    """Parse the distinct sentences that are not cached yet and store them
+    Return: number of parsed sentences"""
+    version = pipeline_version(nlp)
+    todo = [s for s in dict.fromkeys(sents) if not cache.contains(version, s)]
+    disable = [name for name in rerun_pipes if name in nlp.pipe_names]
+
+    docs = nlp.pipe(todo, batch_size=batch_size, disable=disable)
+    for sent, doc in tqdm(zip(todo, docs), total=len(todo), desc="Parsing"):
+        cache.put(version, sent, doc.to_bytes(exclude=["user_data"]))
+    cache.commit()
+
+    return len(todo)
+
+
+def install_parse_cache(dialect, cache):
+    """Let a multi-value dialect object take its parses from the cache"""
+    dialect.nlp = CachedParser(dialect.nlp, cache)
+    return dialect
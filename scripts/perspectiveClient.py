@@ -0,0 +1,114 @@
+"""Long-lived client for the Perspective API (commentanalyzer v1alpha1)
+
+The discovery document is downloaded once and cached on disk, later runs build the
+client from the cached copy without any extra request
+Every worker thread keeps its own API client on top of its own keep-alive HTTP
+connection (httplib2 is not thread-safe), so each request costs only the analyze call
+
+Usage:
+    from perspectiveClient import PerspectiveClient
+    client = PerspectiveClient(api_key)
+    response = client.analyze("some text", ["TOXICITY", "INSULT"])
+    responses = client.analyze_batch(["some text", "more text"], ["TOXICITY"])
+"""
+
+import os
+import json
+import threading
+
+import httplib2
+from googleapiclient import discovery
+
+DISCOVERY_URL = (
+    "https://commentanalyzer.googleapis.com/$discovery/rest?version=v1alpha1"
+)
+DISCOVERY_CACHE = "../cache/commentanalyzer_v1alpha1_discovery.json"
+
+
+def load_discovery_document(api_key, discovery_url, cache_path):
+    """Return the discovery document as a string, download and cache it on first use"""
+    if cache_path and os.path.exists(cache_path):
+        with open(cache_path) as f:
+            return f.read()
+
+    url = discovery_url
+    if api_key:
+        url += ("&" if "?" in url else "?") + f"key={api_key}"
+    response, content = httplib2.Http().request(url)
+    if response.status >= 400:
+        raise RuntimeError(
+            f"Could not load the discovery document ({response.status}): {content[:200]}"
+        )
+    document = content.decode("utf-8")
+    json.loads(document)  # do not cache anything that is not a valid document
+
+    if cache_path:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        with open(cache_path, "w") as f:
+            f.write(document)
+
+    return document
+
+
+def build_analyze_request(text, attributes):
+    """Body of an analyze request for one text and all requested attributes"""
+    return {
+        "comment": {"text": text},
+        "requestedAttributes": {attribute: {} for attribute in attributes},
+    }
+
+
+class PerspectiveClient:
+    """Thread-safe Perspective API client that is built once and reused for all requests"""
+
+    def __init__(
+        self,
+        api_key,
+        discovery_url=DISCOVERY_URL,
+        discovery_cache=DISCOVERY_CACHE,
+        timeout=30,
+    ):
+        self.api_key = api_key
+        self.timeout = timeout
+        self.discovery_document = load_discovery_document(
+            api_key, discovery_url, discovery_cache
+        )
+        self._local = threading.local()
+
+    def service(self):
+        """Return the API client of the current thread, build it on first use"""
+        service = getattr(self._local, "service", None)
+        if service is None:
+            # one keep-alive connection per thread, reused for all of its requests
+            http = httplib2.Http(timeout=self.timeout)
+            service = discovery.build_from_document(
+                self.discovery_document, developerKey=self.api_key, http=http
+            )
+            self._local.service = service
+        return service
+
+    def analyze(self, text, attributes=("TOXICITY",)):
+        """Get the prediction of all requested attributes for a single text instance"""
+        analyze_request = build_analyze_request(text, attributes)
+
+        return self.service().comments().analyze(body=analyze_request).execute()
+
+    def analyze_batch(self, texts, attributes=("TOXICITY",)):
+        """Get the predictions for several text instances in one batch HTTP request
+        Return: list aligned with the texts, the response or the exception of each item
+        """
+        service = self.service()
+        results = [None] * len(texts)
+
+        def collect(request_id, response, exception):
+            results[int(request_id)] = exception if exception is not None else response
+
+        batch = service.new_batch_http_request(callback=collect)
+        for i, text in enumerate(texts):
+            analyze_request = build_analyze_request(text, attributes)
+            batch.add(
+                service.comments().analyze(body=analyze_request), request_id=str(i)
+            )
+        batch.execute()
+
+        return results
@@ -1,5 +1,23 @@
-"""Run Perspective API on all text instances
+"""Run Perspective API (or a local scorer backend) on all text instances
 Save the scores to csv and error indices of each batch as json (simple list)
+All requested attributes (--attributes) are scored in a single request per text
+and saved as one csv column per attribute
+
+Requests are sent concurrently: a token bucket caps the request rate (--qps)
+and a semaphore caps the number of requests in flight (--max-in-flight)
+A single client with a cached discovery document is shared by all requests (perspectiveClient.py)
+With --http-batch-size N, N analyze calls are sent in one batch HTTP request
+Scores are cached on disk by text (scoreCache.py), cached texts are not sent to the API again
+Every result is appended to a journal per batch (scoreJournal.py), an interrupted run
+continues where it stopped with --resume
+With --backend linear, a local linear model trained on the gold labels scores all texts
+offline within seconds (linearScorer.py) and writes the same files to ../scores_linear
+The instances are split into shards (batches) of --shard-size recorded in the manifest
+of the scores directory (shardManifest.py), --shards scores only some of them, e.g. to
+spread the shards over parallel workers
+At the end, all batch files are imported into the consolidated score store (scoreStore.py)
+With --live-stats, running paired t-statistics, increase rates and contingency counts are
+updated with every score and saved to ../outputs/live-stats.json (liveStats.py)
 
 Prequisites:
     - a Google Perspective API key
@@ -7,155 +25,488 @@ Prequisites:
     - converted dialect datasets in jsonl format
 
 Usage:
-    $ python retrievePerspectiveScores.py
+    $ python retrievePerspectiveScores.py [--qps 10] [--max-in-flight 16] [--http-batch-size 20]
+        [--no-cache] [--resume] [--backend perspective|linear] [--scores-dir ../scores]
+        [--attributes TOXICITY SEVERE_TOXICITY INSULT IDENTITY_ATTACK]
+        [--shard-size 5000] [--shards 1 2] [--live-stats]
 """
 
 import pandas as pd
-import json
 import time
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
 from tqdm import tqdm
 
-from googleapiclient import discovery
+from perspectiveClient import PerspectiveClient
+from scoreCache import ScoreCache, SCORE_CACHE
+from scoreJournal import ScoreJournal
+from scoreFiles import save_batch_results, DEFAULT_ATTRIBUTE, SCORES_DIR
+from scoreStore import import_score_files
+from shardManifest import load_or_create_manifest, select_shards, SHARD_SIZE
+from goldLabels import load_gold_index
+from loadHateXplain import load_hatexplain
+from linearScorer import LinearScorerBackend
+from liveStats import LiveStats, live_stats_path
 
+API_KEY = None  # this is a placeholder, replace with your own API key
 
-def get_persp_prediction(text):
-    """Load API key and get the prediction for a single text instance"""
-    API_KEY = None  # this is a placeholder, replace with your own API key
+_client = None
 
-    client = discovery.build(
-        "commentanalyzer",
-        "v1alpha1",
-        developerKey=API_KEY,
-        discoveryServiceUrl="https://commentanalyzer.googleapis.com/$discovery/rest?version=v1alpha1",
-        static_discovery=False,
-    )
 
-    analyze_request = {
-        "comment": {"text": text},
-        "requestedAttributes": {"TOXICITY": {}},
-    }
+def get_client():
+    """Return the shared Perspective API client, build it on first use"""
+    global _client
+    if _client is None:
+        _client = PerspectiveClient(API_KEY)
+    return _client
 
-    response = client.comments().analyze(body=analyze_request).execute()
 
-    return response
+def get_persp_prediction(text, attributes=(DEFAULT_ATTRIBUTE,)):
+    """Get the prediction for a single text instance with the shared client"""
+    return get_client().analyze(text, attributes)
 
 
-def run_batch_on_og(df_batch, n_batch):
-    """Run Perspective API on the original HateXplain dataset in one batch"""
-    error_instances = []
-    scores = []
+def get_persp_batch_prediction(texts, attributes=(DEFAULT_ATTRIBUTE,)):
+    """Get the predictions for several text instances in one batch HTTP request
+    Return: list aligned with the texts, the response or the exception of each item
+    """
+    return get_client().analyze_batch(texts, attributes)
 
-    # get scores for one text instance at a time
-    for i in tqdm(range(len(df_batch))):
-        text = " ".join(list(df_batch["post_tokens"].iloc[i]))
 
-        try:
-            res = get_persp_prediction(text)
-        except Exception as e:
-            error_instances.append(i)
-            print(f"Error at index {i}: {e}")
-            continue
-
-        score = res["attributeScores"]["TOXICITY"]["summaryScore"]["value"]
+def parse_attribute_scores(response, attributes):
+    """Return {attribute: summary score} of an analyze response"""
+    return {
+        attribute: response["attributeScores"][attribute]["summaryScore"]["value"]
+        for attribute in attributes
+    }
 
-        scores.append(score)
-        # print(scores)
-        time.sleep(0.8)  # pause for 0.8 second to avoid rate limit
 
-    scores_df = pd.DataFrame(scores, columns=["score"])
-    scores_df.to_csv(
-        f"../scores/persp_score_original_batch{n_batch}.csv", sep=",", index=False
+class TokenBucket:
+    """Token bucket rate limiter for asyncio
+    Refills `qps` tokens per second up to `burst` tokens, every analyze call takes one token
+    """
+
+    def __init__(self, qps, burst=None):
+        self.qps = qps
+        self.burst = burst if burst is not None else max(1.0, qps)
+        self.tokens = self.burst
+        self.last_refill = time.monotonic()
+        self.lock = None
+
+    async def acquire(self, n=1):
+        """Wait until `n` tokens are available and take them"""
+        if self.lock is None:
+            self.lock = asyncio.Lock()  # bind the lock to the running event loop
+
+        # requests queue up on the lock, so tokens are handed out in arrival order
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.last_refill) * self.qps
+                )
+                self.last_refill = now
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return
+                await asyncio.sleep((n - self.tokens) / self.qps)
+
+
+async def score_texts_async(
+    texts,
+    todo,
+    scores,
+    attributes,
+    qps,
+    max_in_flight,
+    http_batch_size=1,
+    cache=None,
+    journal=None,
+    on_score=None,
+):
+    """Score the texts at the `todo` indices concurrently, write the results into `scores`
+    Each result is a dict {attribute: score} of all requested attributes
+    Concurrency is limited by a token bucket and a maximum number of in-flight requests
+    Texts found in the score cache skip the network, and every distinct text is requested once
+    With http_batch_size > 1, that many analyze calls are packed into one batch HTTP request
+    Every result is appended to the journal and passed to on_score(i, text_scores) as soon as it arrives
+    """
+    # a batch HTTP request takes one token per analyze call it holds
+    bucket = TokenBucket(qps, burst=max(1.0, qps, http_batch_size))
+    in_flight = asyncio.Semaphore(max_in_flight)
+    loop = asyncio.get_running_loop()
+    progress = tqdm(total=len(texts), initial=len(texts) - len(todo))
+
+    def finish(i, text_scores=None, error=None):
+        if error is None:
+            scores[i] = text_scores
+            if journal is not None:
+                journal.record(i, texts[i], text_scores)
+            if on_score is not None:
+                on_score(i, text_scores)
+        else:
+            print(f"Error at index {i}: {error}")
+            if journal is not None:
+                journal.record_error(i, texts[i], str(error))
+        progress.update(1)
+
+    # serve texts from the cache, and collect the indices of every distinct text to request
+    requests = {}  # text (cache key) -> indices waiting for its scores
+    for i in todo:
+        key = cache.key(texts[i], attributes) if cache is not None else texts[i]
+        if key in requests:
+            requests[key].append(i)
+            if cache is not None:
+                cache.hits += 1
+            continue
+        cached = cache.get(texts[i], attributes) if cache is not None else None
+        if cached is not None:
+            finish(i, cached)
+        else:
+            requests[key] = [i]
+
+    pending = list(requests.values())
+    chunks = [
+        pending[k : k + http_batch_size]
+        for k in range(0, len(pending), http_batch_size)
+    ]
+
+    async def request_chunk(chunk, executor):
+        chunk_texts = [texts[indices[0]] for indices in chunk]
+        try:
+            async with in_flight:
+                await bucket.acquire(len(chunk))
+                if http_batch_size == 1:
+                    results = [
+                        await loop.run_in_executor(
+                            executor, get_persp_prediction, chunk_texts[0], attributes
+                        )
+                    ]
+                else:
+                    results = await loop.run_in_executor(
+                        executor, get_persp_batch_prediction, chunk_texts, attributes
+                    )
+        except Exception as e:
+            results = [e] * len(chunk)
+
+        # route every item of the chunk back to the input indices of its text
+        for indices, text, result in zip(chunk, chunk_texts, results):
+            try:
+                if isinstance(result, Exception):
+                    raise result
+                text_scores = parse_attribute_scores(result, attributes)
+            except Exception as e:
+                for i in indices:
+                    finish(i, error=e)
+                continue
+            if cache is not None:
+                cache.put(text, attributes, text_scores)
+            for i in indices:
+                finish(i, text_scores)
+
+    # the API client is blocking, so the requests themselves run in worker threads
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        await asyncio.gather(*(request_chunk(chunk, executor) for chunk in chunks))
+    progress.close()
+
+    return scores
+
+
+def score_texts(
+    texts,
+    attributes=(DEFAULT_ATTRIBUTE,),
+    qps=1.0,
+    max_in_flight=8,
+    http_batch_size=1,
+    cache=None,
+    journal=None,
+    on_score=None,
+):
+    """Score a list of texts with Perspective API on all requested attributes
+    Scores already in the journal (when resuming) are reused without a request
+    Return: tuple ({attribute: score} of successful requests in input order, indices of failed requests)
+    """
+    attributes = list(attributes)
+    scores = [None] * len(texts)
+    if journal is not None:
+        for i, text_scores in journal.completed(texts, attributes).items():
+            scores[i] = text_scores
+            if on_score is not None:
+                on_score(i, text_scores)
+    todo = [i for i in range(len(texts)) if scores[i] is None]
+    if len(todo) < len(texts):
+        print(
+            f"Resuming from the journal: {len(texts) - len(todo)}/{len(texts)} already scored,",
+            f"first unscored index: {todo[0]}" if todo else "nothing left to score",
+        )
+
+    if todo:
+        get_client()  # load the discovery document once, before the worker threads start
+    try:
+        asyncio.run(
+            score_texts_async(
+                texts,
+                todo,
+                scores,
+                attributes,
+                qps,
+                max_in_flight,
+                http_batch_size,
+                cache,
+                journal,
+                on_score,
+            )
+        )
+    finally:
+        # make everything scored so far durable, also on Ctrl-C or a crash
+        if journal is not None:
+            journal.close()
+        if cache is not None:
+            cache.commit()
+    if cache is not None:
+        cache.report()
+
+    error_instances = [i for i, score in enumerate(scores) if score is None]
+    scores = [score for score in scores if score is not None]
+
+    return scores, error_instances
+
+
+class PerspectiveBackend:
+    """Score texts with the Perspective API (concurrent, cached and journaled)
+    Every scorer backend provides score_texts(texts, attributes, journal, instance_ids, on_score)
+    returning a tuple ({attribute: score} of the scored texts in input order, indices of failed texts)
+    and calling on_score(i, {attribute: score}) for every scored text
+    """
+
+    name = "perspective"
+    journaled = True
+
+    def __init__(self, qps=1.0, max_in_flight=8, http_batch_size=1, cache=None):
+        self.qps = qps
+        self.max_in_flight = max_in_flight
+        self.http_batch_size = http_batch_size
+        self.cache = cache
+
+    def score_texts(
+        self,
+        texts,
+        attributes=(DEFAULT_ATTRIBUTE,),
+        journal=None,
+        instance_ids=None,
+        on_score=None,
+    ):
+        return score_texts(
+            texts,
+            attributes,
+            self.qps,
+            self.max_in_flight,
+            self.http_batch_size,
+            self.cache,
+            journal,
+            on_score,
+        )
+
+
+def score_batch(
+    texts,
+    variant,
+    n_batch,
+    backend,
+    attributes=(DEFAULT_ATTRIBUTE,),
+    resume=False,
+    scores_dir=SCORES_DIR,
+    offset=0,
+    live_stats=None,
+):
+    """Score one batch of texts with the backend (and a results journal), then save the batch results
+    `offset` is the index of the first text of the batch in the whole dataset
+    Every score is added to the live statistics (if any) as it arrives
+    """
+    journal = None
+    if backend.journaled:
+        journal = ScoreJournal(
+            f"{scores_dir}/journal_{variant}_batch{n_batch}.jsonl", resume=resume
+        )
+    scores, error_instances = backend.score_texts(
+        texts,
+        attributes,
+        journal=journal,
+        instance_ids=range(offset, offset + len(texts)),
+        on_score=live_stats.listener(variant, offset) if live_stats else None,
     )
-
-    with open(f"../scores/errors_original_batch{n_batch}.json", "w") as f:
-        json.dump(error_instances, f)
+    save_batch_results(
+        scores, error_instances, variant, n_batch, list(attributes), scores_dir
+    )
+    if live_stats is not None:
+        live_stats.save_snapshot()
 
     return True
 
 
-def run_batch_on_dialect(df_batch, dialect, n_batch):
-    """Run Perspective API on any converted dialect dataset in one batch"""
-    error_instances = []
-    scores = []
+def run_batch_on_og(df_batch, n_batch, backend, **batch_options):
+    """Run the scorer backend on the original HateXplain dataset in one batch"""
+    texts = [" ".join(list(tokens)) for tokens in df_batch["post_tokens"]]
 
-    # get scores for one text instance at a time
-    for i in tqdm(range(len(df_batch))):
-        text = df_batch["text"][i]
+    return score_batch(texts, "original", n_batch, backend, **batch_options)
 
-        try:
-            res = get_persp_prediction(text)
-        except Exception as e:
-            error_instances.append(i)
-            print(f"Error at index {i}: {e}")
-            continue
-
-        score = res["attributeScores"]["TOXICITY"]["summaryScore"]["value"]
 
-        scores.append(score)
-        # print(scores)
-        time.sleep(0.8)  # pause for 0.8 second to avoid rate limit
+def run_batch_on_dialect(df_batch, dialect, n_batch, backend, **batch_options):
+    """Run the scorer backend on any converted dialect dataset in one batch"""
+    texts = list(df_batch["text"])
 
-    scores_df = pd.DataFrame(scores, columns=["score"])
-    scores_df.to_csv(
-        f"../scores/persp_score_{dialect}_batch{n_batch}.csv", sep=",", index=False
-    )
-
-    with open(f"../scores/errors_{dialect}_batch{n_batch}.json", "w") as f:
-        json.dump(error_instances, f)
-
-    return True
+    return score_batch(texts, dialect, n_batch, backend, **batch_options)
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--backend",
+        choices=["perspective", "linear"],
+        default="perspective",
+        help="perspective: Perspective API, linear: local model trained on the gold labels",
+    )
+    parser.add_argument(
+        "--scores-dir",
+        default=None,
+        help="directory of the score and error files (default: ../scores for perspective, "
+        "../scores_<backend> otherwise)",
+    )
+    parser.add_argument(
+        "--qps",
+        type=float,
+        default=1.0,
+        help="maximum requests per second, set to the quota of your API key",
+    )
+    parser.add_argument(
+        "--max-in-flight",
+        type=int,
+        default=8,
+        help="maximum number of concurrent HTTP requests",
+    )
+    parser.add_argument(
+        "--http-batch-size",
+        type=int,
+        default=1,
+        help="number of analyze calls packed into one batch HTTP request (1: no batching)",
+    )
+    parser.add_argument(
+        "--cache",
+        default=SCORE_CACHE,
+        help="path of the persistent score cache (SQLite)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always request scores from the API, do not read or write the cache",
+    )
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="reuse the scores in the batch journals and continue with the unscored instances",
+    )
+    parser.add_argument(
+        "--attributes",
+        nargs="+",
+        default=[DEFAULT_ATTRIBUTE],
+        help="Perspective attributes to request, all are scored in one request per text",
+    )
+    parser.add_argument(
+        "--shard-size",
+        type=int,
+        default=SHARD_SIZE,
+        help="instances per batch file, for a scores directory without manifest",
+    )
+    parser.add_argument(
+        "--shards",
+        nargs="+",
+        type=int,
+        default=None,
+        help="batch numbers of the shards to score (default: all)",
+    )
+    parser.add_argument(
+        "--live-stats",
+        action="store_true",
+        help="update t-statistics and increase rates with every score, "
+        "view them with liveStats.py",
+    )
+    args = parser.parse_args()
+
     # read in original data
-    hatexplain_df = pd.read_json(f"../data/hatexplain_original.json").transpose()
-    # run Perspective API on the original data in 4 batches
-    hatexplain_df_batch1 = hatexplain_df[:5000]
-    run_batch_on_og(hatexplain_df_batch1, "1")
-    hatexplain_df_batch2 = hatexplain_df[5000:10000]
-    run_batch_on_og(hatexplain_df_batch2, "2")
-    hatexplain_df_batch3 = hatexplain_df[10000:15000]
-    run_batch_on_og(hatexplain_df_batch3, "3")
-    hatexplain_df_batch4 = hatexplain_df[15000:]
-    run_batch_on_og(hatexplain_df_batch4, "4")
+    hatexplain_df = load_hatexplain(["post_tokens", "annotators"])
+
+    gold = load_gold_index(hatexplain_df=hatexplain_df)
+    cache = None
+    if args.backend == "perspective":
+        cache = None if args.no_cache else ScoreCache(args.cache)
+        backend = PerspectiveBackend(
+            args.qps, args.max_in_flight, args.http_batch_size, cache
+        )
+    else:
+        og_texts = [" ".join(tokens) for tokens in hatexplain_df["post_tokens"]]
+        backend = LinearScorerBackend(og_texts, gold.labels())
+    batch_options = {
+        "attributes": args.attributes,
+        "resume": args.resume,
+        "scores_dir": args.scores_dir
+        or (
+            SCORES_DIR if args.backend == "perspective" else f"../scores_{args.backend}"
+        ),
+    }
+    if args.live_stats:
+        # statistics of the first requested attribute
+        batch_options["live_stats"] = LiveStats(
+            gold.labels(),
+            args.attributes[0],
+            live_stats_path(args.attributes[0], batch_options["scores_dir"]),
+        )
+    manifest = load_or_create_manifest(
+        batch_options["scores_dir"], len(hatexplain_df), args.shard_size
+    )
+    shards = select_shards(manifest, args.shards)
+
+    # run the scorer on the original data, one batch per shard
+    for shard in shards:
+        run_batch_on_og(
+            hatexplain_df[shard["start"] : shard["end"]],
+            shard["n_batch"],
+            backend,
+            offset=shard["start"],
+            **batch_options,
+        )
 
     # do the same for all 4 dialects data, but with different function
-    aave_full = pd.read_json("../data/aave_full.jsonl", lines=True)
-    aave_batch1 = aave_full[:5000].reset_index(drop=True)
-    run_batch_on_dialect(aave_batch1, "aave", "1")
-    aave_batch2 = aave_full[5000:10000].reset_index(drop=True)
-    run_batch_on_dialect(aave_batch2, "aave", "2")
-    aave_batch3 = aave_full[10000:15000].reset_index(drop=True)
-    run_batch_on_dialect(aave_batch3, "aave", "3")
-    aave_batch4 = aave_full[15000:].reset_index(drop=True)
-    run_batch_on_dialect(aave_batch4, "aave", "4")
-
-    nigerianD_full = pd.read_json("../data/nigerianD_full.jsonl", lines=True)
-    nigerianD_batch1 = nigerianD_full[:5000].reset_index(drop=True)
-    run_batch_on_dialect(nigerianD_batch1, "nigerianD", "1")
-    nigerianD_batch2 = nigerianD_full[5000:10000].reset_index(drop=True)
-    run_batch_on_dialect(nigerianD_batch2, "nigerianD", "2")
-    nigerianD_batch3 = nigerianD_full[10000:15000].reset_index(drop=True)
-    run_batch_on_dialect(nigerianD_batch3, "nigerianD", "3")
-    nigerianD_batch4 = nigerianD_full[15000:].reset_index(drop=True)
-    run_batch_on_dialect(nigerianD_batch4, "nigerianD", "4")
-
-    indianD_full = pd.read_json("../data/indianD_full.jsonl", lines=True)
-    indianD_batch1 = indianD_full[:5000].reset_index(drop=True)
-    run_batch_on_dialect(indianD_batch1, "indianD", "1")
-    indianD_batch2 = indianD_full[5000:10000].reset_index(drop=True)
-    run_batch_on_dialect(indianD_batch2, "indianD", "2")
-    indianD_batch3 = indianD_full[10000:15000].reset_index(drop=True)
-    run_batch_on_dialect(indianD_batch3, "indianD", "3")
-    indianD_batch4 = indianD_full[15000:].reset_index(drop=True)
-    run_batch_on_dialect(indianD_batch4, "indianD", "4")
-
-    singlish_full = pd.read_json("../data/singlish_full.jsonl", lines=True)
-    singlish_batch1 = singlish_full[:5000].reset_index(drop=True)
-    run_batch_on_dialect(singlish_batch1, "singlish", "1")
-    singlish_batch2 = singlish_full[5000:10000].reset_index(drop=True)
-    run_batch_on_dialect(singlish_batch2, "singlish", "2")
-    singlish_batch3 = singlish_full[10000:15000].reset_index(drop=True)
-    run_batch_on_dialect(singlish_batch3, "singlish", "3")
-    singlish_batch4 = singlish_full[15000:].reset_index(drop=True)
-    run_batch_on_dialect(singlish_batch4, "singlish", "4")
+    for dialect in ["aave", "nigerianD", "indianD", "singlish"]:
+        dialect_full = pd.read_json(f"../data/{dialect}_full.jsonl", lines=True)
+        if len(dialect_full) != manifest["n_instances"]:
+            raise ValueError(
+                f"{dialect} has {len(dialect_full)} instances, "
+                f"the original data {manifest['n_instances']}"
+            )
+        for shard in shards:
+            dialect_batch = dialect_full[shard["start"] : shard["end"]].reset_index(
+                drop=True
+            )
+            run_batch_on_dialect(
+                dialect_batch,
+                dialect,
+                shard["n_batch"],
+                backend,
+                offset=shard["start"],
+                **batch_options,
+            )
+
+    if cache is not None:
+        cache.close()
+
+    # consolidate all batch files into the memory-mappable score store,
+    # once the shards of other workers are done as well
+    if len(shards) == len(manifest["shards"]):
+        import_score_files(batch_options["scores_dir"], attributes=args.attributes)
+    else:
+        print(
+            "Scored shards",
+            [shard["n_batch"] for shard in shards],
+            "- run scoreStore.py once all shards are scored",
+        )
@@ -0,0 +1,250 @@
+"""Attribute the score changes of the dialects to the multi-value rules applied to each instance
+
+Every line of ../data/{dialect}_full.jsonl records the rules applied to the instance. Per
+dialect, the rules form a sparse instance x rule matrix (CSR, one row per aligned instance);
+its CSC form is the inverted index from a rule to the instances it was applied to
+With the score changes (dialect - original) of the aligned instances:
+    - per rule: number of instances, mean / sd of the change, share of increases, mean change
+      per gold split, and Welch's t-test of the change with vs. without the rule,
+      all from sparse matrix-vector products
+    - ridge regression of the score change on the applied rules (sparse lsqr), the
+      coefficient of a rule is its change with all other rules held fixed
+Everything is linear in the number of applied rules, no dense instance x rule matrix is built
+
+Prequisites:
+    - converted dialect datasets in jsonl format with their rules, dialects without one are skipped
+    - scores of the original and the dialects (score store or batch files)
+
+Usage:
+    $ python ruleAttribution.py [--attribute TOXICITY] [--scores-dir ../scores]
+        [--gold-rule fewer_than_2_normal] [--damp 1.0] [--top 10]
+
+    from ruleAttribution import load_rule_matrix, rule_instances
+    matrix, rules = load_rule_matrix("nigerianD")
+    rule_instances(matrix.tocsc(), rules, "progressives")  # instances the rule was applied to
+
+Outputs:
+    - To ./outputs: rule-attribution.json, per dialect the statistics and regression
+      coefficient of every rule
+      (other attributes, scores directories or gold rules get their name as file name suffix)
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+import scipy.sparse as sp
+
+from scipy.sparse.linalg import lsqr, LinearOperator
+from scipy.stats import t as t_distribution
+
+from alignScores import load_aligned_scores
+from goldLabels import load_gold_index, rule_suffix, DEFAULT_RULE, RULES
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR
+
+DIALECTS = ["aave", "nigerianD", "indianD", "singlish"]
+DAMP = 1.0  # ridge penalty of the regression, keeps rare rules from getting extreme weights
+
+
+def dialect_data_path(dialect):
+    return f"../data/{dialect}_full.jsonl"
+
+
+def load_rule_matrix(dialect, path=None):
+    """Sparse instance x rule matrix of a converted dataset
+    A rule applied several times to an instance counts once
+    Return: tuple (CSR matrix of 0/1, rule names of the columns)"""
+    columns = {}  # rule name -> column
+    indptr = [0]
+    indices = []
+    with open(path or dialect_data_path(dialect)) as f:
+        for line in f:
+            rules = json.loads(line)["rules"]
+            for rule in dict.fromkeys(rules):
+                indices.append(columns.setdefault(rule, len(columns)))
+            indptr.append(len(indices))
+
+    matrix = sp.csr_matrix(
+        (np.ones(len(indices), dtype=np.float64), indices, indptr),
+        shape=(len(indptr) - 1, len(columns)),
+    )
+    return matrix, list(columns)
+
+
+def rule_instances(inverted_index, rules, rule):
+    """Row numbers of the instances a rule was applied to
+    Input: CSC form of the instance x rule matrix and its rule names"""
+    j = rules.index(rule)
+    start, end = inverted_index.indptr[j], inverted_index.indptr[j + 1]
+    return inverted_index.indices[start:end]
+
+
+def rule_statistics(matrix, changes, gold_labels):
+    """Score change statistics of every rule, from sparse products with the change vector
+    Input: instance x rule matrix, score change and gold label of every instance
+    Return: dict of arrays, one value per rule"""
+    rule_t = matrix.T.tocsr()
+    n = np.asarray(matrix.sum(axis=0)).ravel()
+    sums = rule_t @ changes
+    squares = rule_t @ changes**2
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        mean = sums / n
+        variance = (squares - n * mean**2) / (n - 1)
+
+        # the instances without the rule, from the totals
+        n_without = len(changes) - n
+        mean_without = (changes.sum() - sums) / n_without
+        variance_without = (
+            (changes**2).sum() - squares - n_without * mean_without**2
+        ) / (n_without - 1)
+        # Welch's t-test: change with vs. without the rule
+        se2, se2_without = variance / n, variance_without / n_without
+        t_statistic = (mean - mean_without) / np.sqrt(se2 + se2_without)
+        dof = (se2 + se2_without) ** 2 / (
+            se2**2 / (n - 1) + se2_without**2 / (n_without - 1)
+        )
+        stats = {
+            "n": n,
+            "mean_diff": mean,
+            "sd_diff": np.sqrt(np.maximum(variance, 0)),
+            "increase_rate": (rule_t @ (changes > 0).astype(float)) / n,
+            "mean_diff_without": mean_without,
+            "t_statistic": t_statistic,
+            "p_value": 2 * t_distribution.sf(np.abs(t_statistic), dof),
+        }
+        for label, split in [(1, "gtox"), (0, "gntox")]:
+            in_split = (gold_labels == label).astype(float)
+            stats[f"mean_diff_{split}"] = (rule_t @ (changes * in_split)) / (
+                rule_t @ in_split
+            )
+
+    return stats
+
+
+def rule_regression(matrix, changes, damp=DAMP):
+    """Ridge regression of the score change on the applied rules, solved by sparse lsqr
+    The intercept is not penalized: rules and changes are centered, the centered matrix is
+    applied as an operator so the sparse matrix stays sparse
+    Return: tuple (coefficient of every rule, intercept)"""
+    column_means = np.asarray(matrix.mean(axis=0)).ravel()
+    change_mean = changes.mean()
+    centered = LinearOperator(
+        matrix.shape,
+        matvec=lambda v: matrix @ v - column_means @ v,
+        rmatvec=lambda u: matrix.T @ u - column_means * u.sum(),
+        dtype=np.float64,
+    )
+    coefficients = lsqr(
+        centered, changes - change_mean, damp=damp, atol=1e-12, btol=1e-12
+    )[0]
+    return coefficients, change_mean - column_means @ coefficients
+
+
+def attribute_rules(og_scores, dialect_scores, valid, gold_labels, dialect, damp=DAMP):
+    """Rule statistics and regression of one dialect
+    Input: aligned scores of the original and the dialect, validity mask over all instances,
+    gold labels of the aligned instances
+    Return: {"intercept": ..., "rules": {rule: {statistic: value}}}"""
+    matrix, rules = load_rule_matrix(dialect)
+    if matrix.shape[0] != len(valid):
+        raise ValueError(
+            f"{dialect_data_path(dialect)} has {matrix.shape[0]} instances, "
+            f"the scores {len(valid)}"
+        )
+    matrix = matrix[valid]
+    changes = np.asarray(dialect_scores) - np.asarray(og_scores)
+
+    stats = rule_statistics(matrix, changes, np.asarray(gold_labels))
+    coefficients, intercept = rule_regression(matrix, changes, damp)
+    stats["coefficient"] = coefficients
+
+    return {
+        "intercept": float(intercept),
+        "rules": {
+            rule: {
+                key: None if np.isnan(values[j]) else float(values[j])
+                for key, values in stats.items()
+            }
+            for j, rule in enumerate(rules)
+        },
+    }
+
+
+def print_top_rules(dialect, attribution, top=10):
+    """Print the rules with the largest regression coefficients (by absolute value)"""
+    rules = sorted(
+        attribution["rules"].items(), key=lambda item: -abs(item[1]["coefficient"])
+    )
+    print(f"Dialect in test: {dialect} ({len(rules)} rules)")
+    print(
+        f"{'rule':<40} {'n':>6} {'mean diff':>10} {'coefficient':>12} {'p-value':>10}"
+    )
+    for rule, stats in rules[:top]:
+        # rules applied only to instances that are not aligned have no statistics
+        mean_diff = (
+            "n/a" if stats["mean_diff"] is None else f"{stats['mean_diff']:+.4f}"
+        )
+        p_value = "n/a" if stats["p_value"] is None else f"{stats['p_value']:.3g}"
+        print(
+            f"{rule:<40} {int(stats['n']):>6} {mean_diff:>10} "
+            f"{stats['coefficient']:>+12.4f} {p_value:>10}"
+        )
+
+
+def attribute_all_dialects(aligned, valid, gold_labels, damp=DAMP, top=10):
+    """Rule attribution of all dialects that have a converted dataset with rules
+    Return: {dialect: attribution}"""
+    attributions = {}
+    for dialect in DIALECTS:
+        if not os.path.exists(dialect_data_path(dialect)):
+            print(f"Skipping {dialect}: {dialect_data_path(dialect)} not found")
+            continue
+        attributions[dialect] = attribute_rules(
+            aligned["original"], aligned[dialect], valid, gold_labels, dialect, damp
+        )
+        print_top_rules(dialect, attributions[dialect], top)
+
+    return attributions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--attribute",
+        default=DEFAULT_ATTRIBUTE,
+        help="Perspective attribute to analyse, e.g. TOXICITY, INSULT (default: TOXICITY)",
+    )
+    parser.add_argument(
+        "--scores-dir",
+        default=SCORES_DIR,
+        help="directory of the score and error files, e.g. ../scores_linear",
+    )
+    parser.add_argument(
+        "--gold-rule",
+        default=DEFAULT_RULE,
+        choices=RULES,
+        help="how the annotator labels are aggregated to gold labels (default: fewer_than_2_normal)",
+    )
+    parser.add_argument(
+        "--damp", type=float, default=DAMP, help="ridge penalty of the regression"
+    )
+    parser.add_argument(
+        "--top", type=int, default=10, help="number of rules printed per dialect"
+    )
+    args = parser.parse_args()
+
+    gold = load_gold_index()
+    aligned, valid = load_aligned_scores(args.scores_dir, args.attribute)
+    attributions = attribute_all_dialects(
+        aligned, valid, gold.labels(args.gold_rule)[valid], args.damp, args.top
+    )
+
+    suffix = output_suffix(args.attribute, args.scores_dir) + rule_suffix(
+        args.gold_rule
+    )
+    output_name = f"rule-attribution{suffix}.json"
+    with open(f"../outputs/{output_name}", "w") as f:
+        json.dump(attributions, f, indent=4)
+    print(f"Results saved to ./outputs as {output_name} successfully!")
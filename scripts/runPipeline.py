@@ -0,0 +1,350 @@
+"""Incremental pipeline runner: convert -> score -> align -> reliability / significance / cap plots
+
+The stages form a DAG, every stage declares its input and output files; a stage runs only if
+the content hash of its inputs (data, upstream outputs, its script and the local modules the
+script imports) or its command changed since its last run, or if its outputs are missing or
+were modified. An upstream stage that runs again but produces identical outputs does not
+make the downstream stages run
+Fingerprints are kept in ../cache/pipeline_state.json
+
+Stages:
+    - convert: dialect conversion in the multi-value root directory (only with --multivalue-dir,
+      otherwise the converted data in ../data is taken as given)
+    - score: scores of all variants (retrievePerspectiveScores.py, resumes from the journals)
+    - gold: gold-label index (goldLabels.py)
+    - align: consolidated score store (scoreStore.py)
+    - reliability, significance, cap: the analysis scripts, their printed results are saved
+      to ../outputs/logs/{stage}{suffix}.txt
+Outputs that exist but were never produced by the runner (e.g. the scores of the first runs)
+are taken over for the expensive stages (convert, score) instead of being produced again
+An expensive stage with complete outputs never runs by itself: if its inputs or outputs
+changed it is only reported as stale, rerun it with --force (scoring again costs API requests
+and overwrites the published scores)
+
+Usage:
+    $ python runPipeline.py [cap significance] [--force] [--dry-run]
+        [--backend perspective|linear] [--attribute TOXICITY] [--multivalue-dir ../../multi-value]
+    runs the given stages (default: all) after the upstream stages they depend on
+"""
+
+import os
+import sys
+import glob
+import json
+import shutil
+import hashlib
+import argparse
+import subprocess
+
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR
+
+PIPELINE_STATE = "../cache/pipeline_state.json"
+DIALECTS = ["aave", "nigerianD", "indianD", "singlish"]
+CONVERT_MODULES = ["convertTo4Dialects.py", "conversionCache.py", "parseCache.py"]
+
+
+def script_dependencies(script, seen=None):
+    """The script and all modules of ./ it imports, recursively"""
+    seen = set() if seen is None else seen
+    if script in seen or not os.path.exists(script):
+        return seen
+    seen.add(script)
+    with open(script) as f:
+        for line in f:
+            words = line.split()
+            if len(words) >= 2 and words[0] in ("import", "from"):
+                script_dependencies(f"{words[1].split('.')[0]}.py", seen)
+    return seen
+
+
+def build_stages(args):
+    """The pipeline stages in topological order
+    Every stage: name, command or run function, input and output file patterns, upstream stages
+    and the key of its record in the state (per backend and attribute where they matter)
+    """
+    python = sys.executable
+    scores_dir = args.scores_dir or (
+        SCORES_DIR if args.backend == "perspective" else f"../scores_{args.backend}"
+    )
+    suffix = output_suffix(args.attribute, scores_dir)
+    dialect_data = [f"../data/{dialect}_full.jsonl" for dialect in DIALECTS]
+    batch_files = [
+        f"{scores_dir}/persp_score_*_batch*.csv",
+        f"{scores_dir}/errors_*_batch*.json",
+        f"{scores_dir}/manifest.json",
+    ]
+    store_files = [f"{scores_dir}/store/*.npy", f"{scores_dir}/store/meta.json"]
+    gold_files = ["../data/hatexplain_original.gold.npz"]
+    analysis_options = ["--attribute", args.attribute, "--scores-dir", scores_dir]
+
+    return [
+        {
+            "name": "convert",
+            "run": run_convert if args.multivalue_dir else None,
+            "cmd": ["convert", args.multivalue_dir or ""],
+            "inputs": ["../data/hatexplain_original.json", *CONVERT_MODULES],
+            "outputs": dialect_data,
+            "deps": [],
+            "expensive": True,
+        },
+        {
+            "name": "score",
+            "key": f"score{suffix}",
+            "cmd": [
+                python,
+                "retrievePerspectiveScores.py",
+                "--resume",
+                "--backend",
+                args.backend,
+                "--scores-dir",
+                scores_dir,
+                "--attributes",
+                args.attribute,
+            ],
+            "inputs": ["../data/hatexplain_original.json", *dialect_data],
+            "outputs": batch_files,
+            "deps": ["convert"],
+            "expensive": True,
+        },
+        {
+            "name": "gold",
+            "cmd": [python, "goldLabels.py"],
+            "inputs": ["../data/hatexplain_original.json"],
+            "outputs": gold_files,
+            "deps": [],
+        },
+        {
+            "name": "align",
+            "key": f"align{suffix}",
+            "cmd": [python, "scoreStore.py", "--scores-dir", scores_dir],
+            "inputs": batch_files,
+            "outputs": store_files,
+            "deps": ["score"],
+        },
+        {
+            "name": "reliability",
+            "key": f"reliability{suffix}",
+            "cmd": [python, "checkPerspectiveReliability.py", *analysis_options],
+            "inputs": store_files + gold_files,
+            "outputs": [f"../outputs/logs/reliability{suffix}.txt"],
+            "deps": ["align", "gold"],
+            "log": f"../outputs/logs/reliability{suffix}.txt",
+        },
+        {
+            "name": "significance",
+            "key": f"significance{suffix}",
+            "cmd": [python, "testScoreSignificance.py", *analysis_options],
+            "inputs": store_files + gold_files,
+            "outputs": [
+                f"../outputs/score-diff-significance{suffix}.json",
+                f"../outputs/logs/significance{suffix}.txt",
+            ],
+            "deps": ["align", "gold"],
+            "log": f"../outputs/logs/significance{suffix}.txt",
+        },
+        {
+            "name": "cap",
+            "key": f"cap{suffix}",
+            "cmd": [python, "evaluateToxicityCap.py", *analysis_options],
+            "inputs": store_files + gold_files,
+            "outputs": [
+                f"../outputs/all-scores{suffix}.png",
+                f"../outputs/score-increase-percentages{suffix}.png",
+                *[
+                    f"../outputs/{name}-changes{suffix}.png"
+                    for name in ["AAVE", "NigerianD", "IndianD", "Singlish"]
+                ],
+                f"../outputs/logs/cap{suffix}.txt",
+            ],
+            "deps": ["align", "gold"],
+            "log": f"../outputs/logs/cap{suffix}.txt",
+        },
+    ]
+
+
+def run_convert(stage, args):
+    """Run the conversion in the multi-value root directory and copy the results to ../data"""
+    for module in CONVERT_MODULES:
+        shutil.copy(module, args.multivalue_dir)
+    shutil.copy("../data/hatexplain_original.json", args.multivalue_dir)
+    subprocess.run(
+        [sys.executable, "convertTo4Dialects.py", "--resume"],
+        cwd=args.multivalue_dir,
+        check=True,
+    )
+    for dialect in DIALECTS:
+        shutil.copy(
+            f"{args.multivalue_dir}/{dialect}.jsonl", f"../data/{dialect}_full.jsonl"
+        )
+
+
+def run_command(stage, args):
+    """Run the command of a stage, save what it prints if the stage has a log"""
+    if "log" not in stage:
+        subprocess.run(stage["cmd"], check=True)
+        return
+    result = subprocess.run(stage["cmd"], check=True, stdout=subprocess.PIPE, text=True)
+    print(result.stdout, end="")
+    os.makedirs(os.path.dirname(stage["log"]), exist_ok=True)
+    with open(stage["log"], "w") as f:
+        f.write(result.stdout)
+
+
+class Fingerprints:
+    """Content hashes of files, rehashed only when size or mtime changed"""
+
+    def __init__(self, known):
+        self.known = known  # path: [size, mtime_ns, sha256]
+
+    def file(self, path):
+        stat = os.stat(path)
+        known = self.known.get(path)
+        if known and known[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return known[2]
+        digest = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+        self.known[path] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def files(self, patterns):
+        """{path: hash} of all files matching the patterns"""
+        paths = sorted({p for pattern in patterns for p in glob.glob(pattern)})
+        return {path: self.file(path) for path in paths}
+
+    def stage(self, stage):
+        """Hash of the command and all inputs of a stage, including its code"""
+        code = set()
+        for part in stage["cmd"]:
+            if part.endswith(".py"):
+                code |= script_dependencies(part)
+        inputs = self.files(stage["inputs"] + sorted(code))
+        payload = json.dumps(
+            {"cmd": stage["cmd"][1:], "inputs": inputs}, sort_keys=True
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def load_state(path=PIPELINE_STATE):
+    if not os.path.exists(path):
+        return {"stages": {}, "files": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_state(state, path=PIPELINE_STATE):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path + ".tmp", "w") as f:
+        json.dump(state, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def outputs_complete(stage):
+    return all(glob.glob(pattern) for pattern in stage["outputs"])
+
+
+def stale_reason(stage, record, fingerprints, fingerprint):
+    """Why a stage has to run, None if it is up to date"""
+    if record is None:
+        return "never run"
+    if record["fingerprint"] != fingerprint:
+        return "inputs changed"
+    if not outputs_complete(stage):
+        return "outputs missing"
+    if fingerprints.files(stage["outputs"]) != record["outputs"]:
+        return "outputs modified"
+    return None
+
+
+def upstream(stages, targets):
+    """The target stages and all stages they depend on, in pipeline order"""
+    by_name = {stage["name"]: stage for stage in stages}
+    needed = set()
+    todo = list(targets)
+    while todo:
+        name = todo.pop()
+        if name not in needed:
+            needed.add(name)
+            todo.extend(by_name[name]["deps"])
+    return [stage for stage in stages if stage["name"] in needed]
+
+
+def run_pipeline(stages, targets, args, state):
+    """Run the stale stages among the targets and their upstream stages"""
+    fingerprints = Fingerprints(state["files"])
+    for stage in upstream(stages, targets):
+        name = stage["name"]
+        key = stage.get("key", name)
+        record = state["stages"].get(key)
+        fingerprint = fingerprints.stage(stage)
+        runner = stage.get("run", run_command)
+
+        reason = "forced" if name in args.force else None
+        reason = reason or stale_reason(stage, record, fingerprints, fingerprint)
+        if reason is None:
+            print(f"[{name}] up to date")
+            continue
+        if runner is None or (
+            reason == "never run" and stage.get("expensive") and outputs_complete(stage)
+        ):
+            # not runnable here or produced before the runner existed: take the outputs as given
+            if not outputs_complete(stage):
+                raise FileNotFoundError(f"[{name}] cannot run, its outputs are missing")
+            print(f"[{name}] using the existing outputs")
+        elif (
+            stage.get("expensive")
+            and reason not in ("forced", "outputs missing")
+            and outputs_complete(stage)
+        ):
+            # keep the outputs and the old record, the stage stays stale until forced
+            print(f"[{name}] stale ({reason}), not run: rerun with --force {name}")
+            continue
+        else:
+            print(f"[{name}] running ({reason})")
+            if not args.dry_run:
+                runner(stage, args)
+        if args.dry_run:
+            continue
+
+        state["stages"][key] = {
+            "fingerprint": fingerprint,
+            "outputs": fingerprints.files(stage["outputs"]),
+        }
+        save_state(state, args.state)
+
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "stages", nargs="*", help="stages to bring up to date (default: all)"
+    )
+    parser.add_argument(
+        "--force", nargs="*", default=[], help="stages to run even if up to date"
+    )
+    parser.add_argument(
+        "--dry-run", action="store_true", help="only show which stages would run"
+    )
+    parser.add_argument(
+        "--backend", choices=["perspective", "linear"], default="perspective"
+    )
+    parser.add_argument("--scores-dir", default=None)
+    parser.add_argument("--attribute", default=DEFAULT_ATTRIBUTE)
+    parser.add_argument(
+        "--multivalue-dir",
+        default=None,
+        help="multi-value root directory to run the conversion in",
+    )
+    parser.add_argument("--state", default=PIPELINE_STATE)
+    args = parser.parse_args()
+
+    stages = build_stages(args)
+    names = [stage["name"] for stage in stages]
+    unknown = sorted(set(args.stages + args.force) - set(names))
+    if unknown:
+        parser.error(f"unknown stages {unknown}, choose from {names}")
+
+    state = load_state(args.state)
+    run_pipeline(stages, args.stages or names, args, state)
@@ -0,0 +1,91 @@
+"""Persistent, content-addressed cache of Perspective API scores (SQLite)
+
+A cache entry is keyed by the hash of the normalized text, the requested attributes
+and the API version, so the same text is only scored once across variants and runs
+(e.g. dialect sentences left unchanged by the transform, duplicated posts, re-runs)
+
+Usage:
+    from scoreCache import ScoreCache
+    cache = ScoreCache()
+    scores = cache.get(text, ["TOXICITY"])  # None on a cache miss
+    cache.put(text, ["TOXICITY"], {"TOXICITY": 0.42})
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+import unicodedata
+
+SCORE_CACHE = "../cache/perspective_scores.sqlite"
+API_VERSION = "commentanalyzer/v1alpha1"
+
+
+def normalize_text(text):
+    """Normalize unicode and whitespace, the case is kept since it affects the scores"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
+
+
+class ScoreCache:
+    """Map (normalized text, attributes, API version) to the scores of all attributes"""
+
+    def __init__(self, path=SCORE_CACHE, api_version=API_VERSION, commit_every=100):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, scores TEXT NOT NULL)"
+        )
+        self.api_version = api_version
+        self.commit_every = commit_every
+        self.uncommitted = 0
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, text, attributes):
+        """Return the cache key of a text scored on the given attributes"""
+        payload = "\x1f".join(
+            [self.api_version, ",".join(sorted(attributes)), normalize_text(text)]
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, text, attributes):
+        """Return the cached scores as {attribute: score}, or None if not cached"""
+        row = self.conn.execute(
+            "SELECT scores FROM scores WHERE key = ?", (self.key(text, attributes),)
+        ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, text, attributes, scores):
+        """Store the scores {attribute: score} of a text"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO scores (key, scores) VALUES (?, ?)",
+            (self.key(text, attributes), json.dumps(scores)),
+        )
+        self.uncommitted += 1
+        if self.uncommitted >= self.commit_every:
+            self.commit()
+
+    def commit(self):
+        self.conn.commit()
+        self.uncommitted = 0
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def report(self):
+        """Print hits, misses and the hit rate since the cache was opened"""
+        print(
+            f"Score cache: {self.hits} hits / {self.misses} misses"
+            f" (hit rate {self.hit_rate():.2%})"
+        )
+
+    def close(self):
+        self.commit()
+        self.conn.close()
@@ -0,0 +1,88 @@
+"""Read and write the per-batch Perspective API score files in ../scores
+(or another scores directory, e.g. ../scores_linear of the local scorer backend)
+
+    - persp_score_{variant}_batch{n}.csv: one column per requested attribute (e.g. TOXICITY, INSULT)
+      and one row per successfully scored instance
+      (files of the first runs have a single "score" column holding TOXICITY)
+    - errors_{variant}_batch{n}.json: indices in the batch of the instances that failed
+
+Usage:
+    from scoreFiles import read_scores
+    scores = read_scores("../scores/persp_score_aave_batch1.csv", "INSULT")
+"""
+
+import os
+import re
+import json
+import pandas as pd
+
+SCORES_DIR = "../scores"
+DEFAULT_ATTRIBUTE = "TOXICITY"
+LEGACY_SCORE_COLUMN = "score"  # single column of the toxicity-only files
+VARIANTS = ["original", "aave", "nigerianD", "indianD", "singlish"]
+
+
+def score_path(variant, n_batch, scores_dir=SCORES_DIR):
+    return f"{scores_dir}/persp_score_{variant}_batch{n_batch}.csv"
+
+
+def error_path(variant, n_batch, scores_dir=SCORES_DIR):
+    return f"{scores_dir}/errors_{variant}_batch{n_batch}.json"
+
+
+def batch_numbers(variant, scores_dir=SCORES_DIR):
+    """Sorted numbers of the batches of a variant that have a score file"""
+    pattern = re.compile(rf"persp_score_{re.escape(variant)}_batch(\d+)\.csv$")
+    matches = [pattern.match(name) for name in os.listdir(scores_dir)]
+    return sorted(int(match.group(1)) for match in matches if match)
+
+
+def output_suffix(attribute, scores_dir=SCORES_DIR):
+    """Suffix for output file names, empty for the default attribute and scores directory
+    to keep the original names, e.g. "-insult" or "-linear" (for ../scores_linear)"""
+    suffix = "" if attribute == DEFAULT_ATTRIBUTE else f"-{attribute.lower()}"
+    if os.path.normpath(scores_dir) != os.path.normpath(SCORES_DIR):
+        suffix += "-" + os.path.basename(os.path.normpath(scores_dir)).replace(
+            "scores_", ""
+        )
+    return suffix
+
+
+def save_batch_results(
+    rows, error_instances, variant, n_batch, attributes, scores_dir=SCORES_DIR
+):
+    """Save the scores of one batch to csv (one column per attribute) and its error indices to json
+    Input: list of {attribute: score} of the successfully scored instances, in input order
+    """
+    scores_df = pd.DataFrame(rows, columns=attributes)
+    scores_df.to_csv(score_path(variant, n_batch, scores_dir), sep=",", index=False)
+
+    with open(error_path(variant, n_batch, scores_dir), "w") as f:
+        json.dump(error_instances, f)
+
+    return True
+
+
+def read_scores(path, attribute=DEFAULT_ATTRIBUTE):
+    """Read the scores of one attribute from a batch csv as a list"""
+    scores_df = pd.read_csv(path)
+    if attribute in scores_df.columns:
+        return list(scores_df[attribute])
+    if attribute == DEFAULT_ATTRIBUTE and LEGACY_SCORE_COLUMN in scores_df.columns:
+        return list(scores_df[LEGACY_SCORE_COLUMN])
+
+    raise ValueError(
+        f"{path} has no scores for {attribute}, available: {list(scores_df.columns)}"
+    )
+
+
+def read_errors(path):
+    """Read the error indices of a batch"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def read_attributes(path):
+    """Names of the attributes with scores in a batch csv"""
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    return [DEFAULT_ATTRIBUTE if c == LEGACY_SCORE_COLUMN else c for c in columns]
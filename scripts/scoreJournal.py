@@ -0,0 +1,102 @@
+"""Append-only journal of Perspective API results for crash-safe, resumable scoring
+
+Every result is appended to a jsonl file as soon as it arrives, one line per request:
+    {"i": <index in batch>, "h": <text hash>, "scores": {<attribute>: <score>, ...}}
+    {"i": <index in batch>, "h": <text hash>, "error": <message>}
+The file is fsynced periodically, so a crash loses at most the last few results
+When resuming, the scores in the journal are reused for all indices whose text is unchanged
+
+Usage:
+    from scoreJournal import ScoreJournal
+    journal = ScoreJournal("../scores/journal_original_batch1.jsonl", resume=True)
+    scores = journal.completed(texts, ["TOXICITY"])  # {index: {attribute: score}}
+    journal.record(i, texts[i], {"TOXICITY": 0.42})
+    journal.close()
+"""
+
+import os
+import json
+import time
+import hashlib
+
+
+def text_hash(text):
+    """Short hash to check that a journaled score belongs to the same text"""
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def read_journal(path):
+    """Read all records of a journal, a torn last line (crash during write) is ignored"""
+    records = []
+    if not os.path.exists(path):
+        return records
+
+    with open(path) as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+class ScoreJournal:
+    """Append results to a jsonl journal and fsync every `fsync_every` records or `fsync_interval` seconds"""
+
+    def __init__(self, path, resume=False, fsync_every=100, fsync_interval=5.0):
+        self.path = path
+        self.records = read_journal(path) if resume else []
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        if resume:
+            # rewrite the valid records, so that a torn last line is not followed by new ones
+            with open(path, "w") as f:
+                for record in self.records:
+                    f.write(json.dumps(record) + "\n")
+        self.file = open(path, "a" if resume else "w")
+
+    def completed(self, texts, attributes):
+        """Return {index: {attribute: score}} of the journaled results that are still valid
+        for the texts and hold all requested attributes
+        Errors are not returned, so failed requests are retried on resume"""
+        scores = {}
+        for record in self.records:
+            i = record["i"]
+            if i < len(texts) and record["h"] == text_hash(texts[i]):
+                if "scores" in record and set(attributes) <= set(record["scores"]):
+                    scores[i] = {a: record["scores"][a] for a in attributes}
+                else:
+                    scores.pop(i, None)
+        return scores
+
+    def _append(self, record):
+        self.file.write(json.dumps(record) + "\n")
+        self.unsynced += 1
+        if (
+            self.unsynced >= self.fsync_every
+            or time.monotonic() - self.last_sync >= self.fsync_interval
+        ):
+            self.sync()
+
+    def record(self, i, text, scores):
+        self._append({"i": i, "h": text_hash(text), "scores": scores})
+
+    def record_error(self, i, text, message):
+        self._append({"i": i, "h": text_hash(text), "error": message})
+
+    def sync(self):
+        """Flush the journal and force it to disk"""
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        self.unsynced = 0
+        self.last_sync = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.sync()
+            self.file.close()
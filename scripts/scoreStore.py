@@ -0,0 +1,209 @@
+"""Consolidated score store: all scores of all variants in one memory-mappable matrix per attribute
+
+Replaces reading the 40 per-batch csv/json files of ../scores with a single open:
+    - {scores_dir}/store/{ATTRIBUTE}.npy: float64 matrix, variants x instances (global instance ids),
+      NaN where the instance could not be scored
+    - {scores_dir}/store/meta.json: variants (row order), number of instances, attributes,
+      instance range of every batch, and size/mtime of the imported files to detect stale stores
+Every batch is placed at its global instance range in the sharding manifest of the scores
+directory (shardManifest.py); without a manifest, the batches are placed one after another
+
+Usage:
+    import the existing batch files (done automatically when loading a missing or stale store):
+    $ python scoreStore.py [--scores-dir ../scores] [--attributes TOXICITY INSULT]
+
+    from scoreStore import load_scores
+    scores, meta = load_scores()  # memory-mapped, no parsing
+    aave_scores = scores[meta["variants"].index("aave")]
+"""
+
+import os
+import json
+import argparse
+
+import numpy as np
+
+from scoreFiles import (
+    SCORES_DIR,
+    VARIANTS,
+    DEFAULT_ATTRIBUTE,
+    score_path,
+    error_path,
+    batch_numbers,
+    read_scores,
+    read_errors,
+    read_attributes,
+)
+from shardManifest import read_manifest, manifest_path
+
+# float32 would round the 8-digit API scores and shift the published test statistics
+STORE_DTYPE = np.float64
+
+
+def store_dir(scores_dir=SCORES_DIR):
+    return f"{scores_dir}/store"
+
+
+def file_fingerprint(path):
+    stat = os.stat(path)
+    return [stat.st_size, stat.st_mtime_ns]
+
+
+def variant_batches(scores_dir, variant, manifest=None):
+    """Batch numbers of a variant, from the manifest if there is one"""
+    if manifest is not None:
+        return [shard["n_batch"] for shard in manifest["shards"]]
+    return batch_numbers(variant, scores_dir)
+
+
+def source_files(scores_dir, variants):
+    """All batch files (and the manifest) that make up the store"""
+    manifest = read_manifest(scores_dir)
+    paths = [] if manifest is None else [manifest_path(scores_dir)]
+    for variant in variants:
+        for n_batch in variant_batches(scores_dir, variant, manifest):
+            paths.append(score_path(variant, n_batch, scores_dir))
+            paths.append(error_path(variant, n_batch, scores_dir))
+    return paths
+
+
+def read_batch(scores_dir, variant, n_batch, attribute):
+    """Scores of one batch in instance order, NaN for failed instances"""
+    scores = read_scores(score_path(variant, n_batch, scores_dir), attribute)
+    errors = read_errors(error_path(variant, n_batch, scores_dir))
+
+    column = np.full(len(scores) + len(errors), np.nan, dtype=STORE_DTYPE)
+    scored = np.ones(len(column), dtype=bool)
+    scored[errors] = False
+    column[scored] = scores
+    return column
+
+
+def read_variant(scores_dir, variant, attribute, manifest=None):
+    """Scores of one variant over all its batches in instance order, NaN for failed instances
+    Return: tuple (scores as array, list of batch instance ranges)"""
+    if manifest is not None:
+        scores = np.full(manifest["n_instances"], np.nan, dtype=STORE_DTYPE)
+        for shard in manifest["shards"]:
+            column = read_batch(scores_dir, variant, shard["n_batch"], attribute)
+            if len(column) != shard["end"] - shard["start"]:
+                raise ValueError(
+                    f"Batch {shard['n_batch']} of {variant} has {len(column)} instances, "
+                    f"the manifest expects {shard['end'] - shard['start']}"
+                )
+            scores[shard["start"] : shard["end"]] = column
+        return scores, manifest["shards"]
+
+    columns = []
+    batches = []
+    start = 0
+    for n_batch in batch_numbers(variant, scores_dir):
+        column = read_batch(scores_dir, variant, n_batch, attribute)
+        columns.append(column)
+        batches.append({"n_batch": n_batch, "start": start, "end": start + len(column)})
+        start += len(column)
+
+    if not columns:
+        raise FileNotFoundError(f"No score files of {variant} in {scores_dir}")
+    return np.concatenate(columns), batches
+
+
+def import_score_files(scores_dir=SCORES_DIR, variants=VARIANTS, attributes=None):
+    """Import the per-batch score and error files into the store
+    Attributes default to those scored in every variant
+    Return: the meta data of the store"""
+    manifest = read_manifest(scores_dir)
+    if attributes is None:
+        available = [
+            set(
+                read_attributes(
+                    score_path(
+                        v, variant_batches(scores_dir, v, manifest)[0], scores_dir
+                    )
+                )
+            )
+            for v in variants
+        ]
+        attributes = sorted(set.intersection(*available))
+
+    os.makedirs(store_dir(scores_dir), exist_ok=True)
+    meta = {"variants": list(variants), "attributes": attributes, "batches": {}}
+    for attribute in attributes:
+        rows = []
+        for variant in variants:
+            row, meta["batches"][variant] = read_variant(
+                scores_dir, variant, attribute, manifest
+            )
+            rows.append(row)
+        if len({len(row) for row in rows}) != 1:
+            raise ValueError(
+                f"Variants have different numbers of instances: "
+                f"{dict(zip(variants, map(len, rows)))}"
+            )
+        meta["n_instances"] = len(rows[0])
+
+        # write to a temporary file first, so readers never see a half-written store
+        path = f"{store_dir(scores_dir)}/{attribute}.npy"
+        with open(path + ".tmp", "wb") as f:
+            np.save(f, np.vstack(rows))
+        os.replace(path + ".tmp", path)
+
+    meta["sources"] = {
+        path: file_fingerprint(path) for path in source_files(scores_dir, variants)
+    }
+    with open(f"{store_dir(scores_dir)}/meta.json", "w") as f:
+        json.dump(meta, f, indent=4)
+
+    return meta
+
+
+def store_is_stale(scores_dir, meta):
+    """True if batch files were added, removed or changed since the import"""
+    current = source_files(scores_dir, meta["variants"])
+    if sorted(current) != sorted(meta["sources"]):
+        return True
+    return any(file_fingerprint(path) != meta["sources"][path] for path in current)
+
+
+def open_score_store(scores_dir=SCORES_DIR, attribute=DEFAULT_ATTRIBUTE, mmap_mode="r"):
+    """Open the score matrix of one attribute without copying it into memory
+    Return: tuple (variants x instances matrix, meta data)"""
+    with open(f"{store_dir(scores_dir)}/meta.json") as f:
+        meta = json.load(f)
+    if attribute not in meta["attributes"]:
+        raise FileNotFoundError(f"The score store has no scores for {attribute}")
+
+    scores = np.load(f"{store_dir(scores_dir)}/{attribute}.npy", mmap_mode=mmap_mode)
+    return scores, meta
+
+
+def load_scores(scores_dir=SCORES_DIR, attribute=DEFAULT_ATTRIBUTE, variants=VARIANTS):
+    """Open the score store, (re-)import the batch files first if it is missing or stale"""
+    try:
+        scores, meta = open_score_store(scores_dir, attribute)
+        if meta["variants"] == list(variants) and not store_is_stale(scores_dir, meta):
+            return scores, meta
+    except FileNotFoundError:
+        pass
+
+    import_score_files(scores_dir, variants)
+    return open_score_store(scores_dir, attribute)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--scores-dir", default=SCORES_DIR)
+    parser.add_argument(
+        "--attributes",
+        nargs="+",
+        default=None,
+        help="attributes to import (default: all attributes scored in every variant)",
+    )
+    args = parser.parse_args()
+
+    meta = import_score_files(args.scores_dir, attributes=args.attributes)
+    print(
+        f"Imported {len(meta['sources'])} files: {len(meta['variants'])} variants x "
+        f"{meta['n_instances']} instances, attributes {meta['attributes']}"
+    )
+    print(f"Saved to {store_dir(args.scores_dir)}")
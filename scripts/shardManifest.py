@@ -0,0 +1,92 @@
+"""Sharding manifest of a scores directory: which global instances each batch file holds
+
+{scores_dir}/manifest.json records the number of instances, the shard size and the global
+instance range [start, end) of every shard (batch); the shards of all variants are the same
+The scorer splits the texts by the manifest and the score store places every batch file at
+its range, so nothing assumes a fixed batch size. Shards can be scored by separate workers
+(retrievePerspectiveScores.py --shards 1 2) as long as they share the manifest
+
+Usage:
+    from shardManifest import load_or_create_manifest
+    manifest = load_or_create_manifest("../scores", n_instances=20148, shard_size=5000)
+    for shard in manifest["shards"]:
+        texts[shard["start"] : shard["end"]]  # texts of batch shard["n_batch"]
+"""
+
+import os
+import json
+
+MANIFEST_NAME = "manifest.json"
+SHARD_SIZE = 5000
+
+
+def manifest_path(scores_dir):
+    return f"{scores_dir}/{MANIFEST_NAME}"
+
+
+def plan_shards(n_instances, shard_size=SHARD_SIZE):
+    """Consecutive shards of shard_size instances, the last one holds the rest"""
+    return [
+        {
+            "n_batch": n_batch,
+            "start": start,
+            "end": min(start + shard_size, n_instances),
+        }
+        for n_batch, start in enumerate(range(0, n_instances, shard_size), start=1)
+    ]
+
+
+def read_manifest(scores_dir):
+    """The manifest of a scores directory, None if it has none"""
+    if not os.path.exists(manifest_path(scores_dir)):
+        return None
+    with open(manifest_path(scores_dir)) as f:
+        return json.load(f)
+
+
+def write_manifest(scores_dir, manifest):
+    path = manifest_path(scores_dir)
+    # write to a temporary file first, so parallel workers never read a half-written manifest
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=4)
+    os.replace(path + ".tmp", path)
+
+
+def load_or_create_manifest(scores_dir, n_instances, shard_size=SHARD_SIZE):
+    """Read the manifest of a scores directory, create it if there is none
+    An existing manifest is kept (its shards have been scored with it) and must
+    cover the same number of instances"""
+    manifest = read_manifest(scores_dir)
+    if manifest is None:
+        manifest = {
+            "n_instances": n_instances,
+            "shard_size": shard_size,
+            "shards": plan_shards(n_instances, shard_size),
+        }
+        os.makedirs(scores_dir, exist_ok=True)
+        write_manifest(scores_dir, manifest)
+    elif manifest["n_instances"] != n_instances:
+        raise ValueError(
+            f"{manifest_path(scores_dir)} covers {manifest['n_instances']} instances, "
+            f"the data has {n_instances}: use another scores directory"
+        )
+    elif manifest["shard_size"] != shard_size:
+        print(
+            f"Keeping the shards of {manifest_path(scores_dir)} "
+            f"(shard size {manifest['shard_size']}, not {shard_size})"
+        )
+
+    return manifest
+
+
+def select_shards(manifest, n_batches=None):
+    """The shards with the given batch numbers, all shards if None"""
+    if n_batches is None:
+        return manifest["shards"]
+    known = {shard["n_batch"] for shard in manifest["shards"]}
+    unknown = sorted(set(n_batches) - known)
+    if unknown:
+        raise ValueError(
+            f"The manifest has no shards {unknown}, only 1 to {len(known)}"
+        )
+    return [shard for shard in manifest["shards"] if shard["n_batch"] in n_batches]
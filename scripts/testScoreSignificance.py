@@ -1,115 +1,25 @@
 """Test the significance of the toxicity scores of original and dialect text data by PerspectiveAPI
 Applied statistical hypothesis test: Paired t-test, suitable for parallel datesets with corresponding instances
+Scores pile up near 0 and 1, so a paired permutation test, bootstrap confidence intervals and
+effect sizes of the score differences are added (pairedResampling.py)
 
 Usage:
-    $ python testScoreSignificance.py
+    $ python testScoreSignificance.py [--attribute TOXICITY] [--scores-dir ../scores]
+        [--gold-rule fewer_than_2_normal] [--n-resamples 10000] [--workers 1]
 
 Outputs:
     - To ./outputs: statistical test results in a .json file
+      (other attributes, scores directories or gold rules get their name as file name suffix)
 """
 
-import pandas as pd
 import json
+import argparse
 from scipy.stats import ttest_rel
 
-
-def process_batch(batchn):
-    """Process one batch, drop errors from the scores and
-    Return the scores and the list of error indices across all 5 variants"""
-    og_scores = list(
-        pd.read_csv(f"../scores/persp_score_original_{batchn}.csv")["score"]
-    )
-    aave_scores = list(pd.read_csv(f"../scores/persp_score_aave_{batchn}.csv")["score"])
-    nigerianD_scores = list(
-        pd.read_csv(f"../scores/persp_score_nigerianD_{batchn}.csv")["score"]
-    )
-    indianD_scores = list(
-        pd.read_csv(f"../scores/persp_score_indianD_{batchn}.csv")["score"]
-    )
-    singlish_scores = list(
-        pd.read_csv(f"../scores/persp_score_singlish_{batchn}.csv")["score"]
-    )
-
-    og_errors = json.load(open(f"../scores/errors_original_{batchn}.json"))
-    aave_errors = json.load(open(f"../scores/errors_aave_{batchn}.json"))
-    nigerianD_errors = json.load(open(f"../scores/errors_nigerianD_{batchn}.json"))
-    indianD_errors = json.load(open(f"../scores/errors_indianD_{batchn}.json"))
-    singlish_errors = json.load(open(f"../scores/errors_singlish_{batchn}.json"))
-
-    for idx in og_errors:
-        og_scores.insert(idx, 0)
-    for idx in aave_errors:
-        aave_scores.insert(idx, 0)
-    for idx in nigerianD_errors:
-        nigerianD_scores.insert(idx, 0)
-    for idx in indianD_errors:
-        indianD_scores.insert(idx, 0)
-    for idx in singlish_errors:
-        singlish_scores.insert(idx, 0)
-
-    # instances that are not processed by PerspectiveAPI in the current batch
-    to_drop = sorted(
-        list(
-            set(
-                og_errors
-                + aave_errors
-                + nigerianD_errors
-                + indianD_errors
-                + singlish_errors
-            )
-        ),
-        reverse=True,
-    )
-
-    for idx in to_drop:
-        del og_scores[idx]
-        del aave_scores[idx]
-        del nigerianD_scores[idx]
-        del indianD_scores[idx]
-        del singlish_scores[idx]
-
-    return (
-        og_scores,
-        aave_scores,
-        nigerianD_scores,
-        indianD_scores,
-        singlish_scores,
-        to_drop,
-    )
-
-
-def split_tox_nontox(hatexplain_df, to_drop, scores):
-    """Split the scores into toxic and non-toxic based on gold labels
-    Input: scores of original or dialect text data (all instances)
-    Return: tuple of two lists (scores of gold toxic instances, scores of gold non-toxic instances)
-    """
-    gold_labels = []
-    for i in range(len(hatexplain_df)):
-        annotations = [an["label"] for an in hatexplain_df["annotators"].iloc[i]]
-        # if less than two annotators labeled current sentence as normal, consider it toxic
-        if annotations.count("normal") < 2:
-            gold_labels.append(1)
-        else:
-            gold_labels.append(0)
-
-    # drop error indices by Perspective also from gold labels
-    for idx in to_drop:
-        del gold_labels[idx]
-
-    # given gold toxic labels, check how Perspective API scores the sentences
-    gtox_scores = []
-    # given gold non-toxic labels, check how Perspective API scores the sentences
-    gntox_scores = []
-
-    for i in range(len(gold_labels)):
-        if gold_labels[i] == 1:
-            gtox_scores.append(scores[i])
-        else:
-            gntox_scores.append(scores[i])
-
-    score_splits = (gtox_scores, gntox_scores)
-
-    return score_splits
+from alignScores import load_aligned_scores
+from goldLabels import load_gold_index, rule_suffix, DEFAULT_RULE, RULES
+from pairedResampling import paired_resampling_tests, N_RESAMPLES, SEED
+from scoreFiles import output_suffix, DEFAULT_ATTRIBUTE, SCORES_DIR
 
 
 def test_score_significance(og_splits, dialect_splits):
@@ -162,34 +72,88 @@ def test_score_significance(og_splits, dialect_splits):
     }
 
 
+def test_resampling_significance(
+    og_splits, dialect_splits, significance_all, n_resamples=N_RESAMPLES, workers=1
+):
+    """Run the permutation and bootstrap tests of all dialects and gold splits in one pass
+    Input: {dialect name: splits}, t-test results keyed "Original vs. {dialect name}"
+    Return: the t-test results, every entry with the effect sizes, confidence interval and
+    permutation p-value under "dialect_minus_original"
+    (the t-statistic is of original - dialect, as computed by ttest_rel(og, dialect))
+    """
+    results = paired_resampling_tests(
+        og_splits, dialect_splits, n_resamples, workers=workers, seed=SEED
+    )
+    print(
+        f"Paired permutation / bootstrap tests of dialect - original ({n_resamples} resamples)"
+    )
+    for name, splits in results.items():
+        for split, stats in splits.items():
+            cohen_dz = stats["cohen_dz"]
+            print(
+                f"{name:<10} {split:<6}",
+                f"mean diff: {stats['mean_diff']:+.4f}",
+                f"95% CI: [{stats['ci_low']:+.4f}, {stats['ci_high']:+.4f}]",
+                f"d_z: {'-' if cohen_dz is None else f'{cohen_dz:+.3f}'}",
+                f"permutation p: {stats['permutation_p_value']:.4g}",
+            )
+            significance_all[f"Original vs. {name}"][split][
+                "dialect_minus_original"
+            ] = stats
+
+    return significance_all
+
+
 if __name__ == "__main__":
-    # original HateXplain dataset with gold annotation labels
-    hatexplain_df = pd.read_json(f"../data/hatexplain_original.json").transpose()
-
-    og1, aave1, nigerianD1, indianD1, singlish1, to_drop1 = process_batch("batch1")
-    og2, aave2, nigerianD2, indianD2, singlish2, to_drop2 = process_batch("batch2")
-    og3, aave3, nigerianD3, indianD3, singlish3, to_drop3 = process_batch("batch3")
-    og4, aave4, nigerianD4, indianD4, singlish4, to_drop4 = process_batch("batch4")
-
-    og_scores = og1 + og2 + og3 + og4
-    aave_scores = aave1 + aave2 + aave3 + aave4
-    nigerianD_scores = nigerianD1 + nigerianD2 + nigerianD3 + nigerianD4
-    indianD_scores = indianD1 + indianD2 + indianD3 + indianD4
-    singlish_scores = singlish1 + singlish2 + singlish3 + singlish4
-
-    # collect all error indexes by adding the offset
-    to_drop2 = [i + 5000 for i in to_drop2]
-    to_drop3 = [i + 10000 for i in to_drop3]
-    to_drop4 = [i + 15000 for i in to_drop4]
-    to_drop = sorted(to_drop1 + to_drop2 + to_drop3 + to_drop4, reverse=True)
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument(
+        "--attribute",
+        default=DEFAULT_ATTRIBUTE,
+        help="Perspective attribute to analyse, e.g. TOXICITY, INSULT (default: TOXICITY)",
+    )
+    parser.add_argument(
+        "--scores-dir",
+        default=SCORES_DIR,
+        help="directory of the score and error files, e.g. ../scores_linear",
+    )
+    parser.add_argument(
+        "--gold-rule",
+        default=DEFAULT_RULE,
+        choices=RULES,
+        help="how the annotator labels are aggregated to gold labels (default: fewer_than_2_normal)",
+    )
+    parser.add_argument(
+        "--n-resamples",
+        type=int,
+        default=N_RESAMPLES,
+        help="permutations and bootstrap samples of the resampling tests (default: 10000)",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="processes sharing the resamples (default: 1)",
+    )
+    args = parser.parse_args()
+
+    # gold labels of the original HateXplain dataset
+    gold = load_gold_index()
+
+    # scores of all variants, aligned over the instances scored in every variant
+    aligned, valid = load_aligned_scores(args.scores_dir, args.attribute)
+    og_scores = aligned["original"].tolist()
+    aave_scores = aligned["aave"].tolist()
+    nigerianD_scores = aligned["nigerianD"].tolist()
+    indianD_scores = aligned["indianD"].tolist()
+    singlish_scores = aligned["singlish"].tolist()
 
     # split scores og text data according to gold labels, as base standard
-    og_splits = split_tox_nontox(hatexplain_df, to_drop, og_scores)
+    og_splits = gold.split(og_scores, valid, args.gold_rule)
     # do the same for dialects, these are to be compared to the original scores
-    aave_splits = split_tox_nontox(hatexplain_df, to_drop, aave_scores)
-    nigerianD_splits = split_tox_nontox(hatexplain_df, to_drop, nigerianD_scores)
-    indianD_splits = split_tox_nontox(hatexplain_df, to_drop, indianD_scores)
-    singlish_splits = split_tox_nontox(hatexplain_df, to_drop, singlish_scores)
+    aave_splits = gold.split(aave_scores, valid, args.gold_rule)
+    nigerianD_splits = gold.split(nigerianD_scores, valid, args.gold_rule)
+    indianD_splits = gold.split(indianD_scores, valid, args.gold_rule)
+    singlish_splits = gold.split(singlish_scores, valid, args.gold_rule)
 
     # test the significance of the scores
     print("Original vs. AAVE")
@@ -211,7 +175,24 @@ if __name__ == "__main__":
         "Original vs. IndianD": stats_indianD,
         "Original vs. Singlish": stats_singlish,
     }
-    with open("../outputs/score-diff-significance.json", "w") as f:
+    print("-" * 50)
+    test_resampling_significance(
+        og_splits,
+        {
+            "AAVE": aave_splits,
+            "NigerianD": nigerianD_splits,
+            "IndianD": indianD_splits,
+            "Singlish": singlish_splits,
+        },
+        significance_all,
+        args.n_resamples,
+        args.workers,
+    )
+    suffix = output_suffix(args.attribute, args.scores_dir) + rule_suffix(
+        args.gold_rule
+    )
+    output_name = f"score-diff-significance{suffix}.json"
+    with open(f"../outputs/{output_name}", "w") as f:
         json.dump(significance_all, f, indent=4)
     print("-" * 50)
-    print("Results saved to ./outputs as score-diff-significance.json successfully!")
+    print(f"Results saved to ./outputs as {output_name} successfully!")
@@ -0,0 +1,107 @@
+"""Confusion matrix, Chi-square, precision/recall and ROC/PR curves at every score threshold
+
+A score >= threshold counts as toxic. The scores of every variant are sorted once, the
+cumulative count of gold toxic instances over the sorted scores gives the confusion matrix at
+any threshold by a binary search, so all thresholds of all variants take one vectorized pass
+instead of one contingency table per threshold
+The default thresholds are all distinct scores of all variants (exact curves of every variant)
+
+Usage:
+    from thresholdSweep import sweep_thresholds, curve_summary
+    sweep = sweep_thresholds(scores, gold_labels)  # variants x instances, labels 0/1
+    sweep["tp"][v, i]  # true positives of variant v at sweep["thresholds"][i]
+    curve_summary(sweep)  # ROC AUC, average precision, best F1 per variant
+"""
+
+import numpy as np
+
+from scipy.stats import chi2 as chi2_distribution
+
+
+def confusion_counts(scores, gold_labels, thresholds):
+    """tp, fp, fn, tn of every variant at every threshold
+    Input: variants x instances scores, 0/1 gold labels of the instances, sorted thresholds
+    Return: dict of variants x thresholds arrays"""
+    scores = np.atleast_2d(scores)
+    gold_labels = np.asarray(gold_labels)
+    order = np.argsort(scores, axis=1, kind="stable")
+    sorted_scores = np.take_along_axis(scores, order, axis=1)
+    # gold toxic among the k lowest scores, for k = 0..n
+    toxic_below = np.zeros((scores.shape[0], scores.shape[1] + 1), dtype=np.int64)
+    np.cumsum(gold_labels[order], axis=1, out=toxic_below[:, 1:])
+
+    # number of scores below each threshold, i.e. predicted non-toxic
+    n_below = np.stack([np.searchsorted(row, thresholds) for row in sorted_scores])
+    positives = int(gold_labels.sum())
+    negatives = len(gold_labels) - positives
+
+    fn = np.take_along_axis(toxic_below, n_below, axis=1)
+    tn = n_below - fn
+    return {"tp": positives - fn, "fp": negatives - tn, "fn": fn, "tn": tn}
+
+
+def chi_square(tp, fp, fn, tn):
+    """Chi-square test of independence of gold and predicted labels at every threshold
+    Same as scipy.stats.chi2_contingency on each 2x2 table (with Yates' correction)
+    Return: tuple (statistics, p-values), NaN where a table has an empty row or column
+    """
+    observed = np.stack([tp, fn, fp, tn]).astype(float)
+    n = observed.sum(axis=0)
+    rows = [tp + fn, tp + fn, fp + tn, fp + tn]  # gold toxic, gold non-toxic
+    cols = [tp + fp, fn + tn, tp + fp, fn + tn]  # predicted toxic, predicted non-toxic
+    with np.errstate(divide="ignore", invalid="ignore"):
+        expected = np.stack([r * c for r, c in zip(rows, cols)]) / n
+        diff = expected - observed
+        corrected = observed + np.sign(diff) * np.minimum(0.5, np.abs(diff))
+        statistic = ((corrected - expected) ** 2 / expected).sum(axis=0)
+    statistic[(expected == 0).any(axis=0)] = np.nan
+
+    return statistic, chi2_distribution.sf(statistic, 1)
+
+
+def sweep_thresholds(scores, gold_labels, thresholds=None):
+    """Confusion matrix, Chi-square and curve points of every variant at every threshold
+    Input: variants x instances scores, 0/1 gold labels, optional thresholds
+    Return: dict of arrays (thresholds, and variants x thresholds for the rest)"""
+    scores = np.atleast_2d(np.asarray(scores, dtype=float))
+    if thresholds is None:
+        # above the highest score nothing is toxic: the (0, 0) end of the ROC curve
+        thresholds = np.append(np.unique(scores), np.inf)
+    thresholds = np.sort(np.asarray(thresholds, dtype=float))
+
+    sweep = {"thresholds": thresholds}
+    sweep.update(confusion_counts(scores, gold_labels, thresholds))
+    tp, fp, fn, tn = sweep["tp"], sweep["fp"], sweep["fn"], sweep["tn"]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        sweep["precision"] = tp / (tp + fp)
+        sweep["recall"] = tp / (tp + fn)  # true positive rate
+        sweep["fpr"] = fp / (fp + tn)
+        sweep["f1"] = 2 * tp / (2 * tp + fp + fn)
+    sweep["chi2"], sweep["p_value"] = chi_square(tp, fp, fn, tn)
+
+    return sweep
+
+
+def curve_summary(sweep, variants=None):
+    """ROC AUC, average precision and the threshold of the best F1 of every variant
+    Return: list of dicts, or {variant: dict} if variant names are given"""
+    # from the highest to the lowest threshold: recall and fpr grow
+    recall = sweep["recall"][:, ::-1]
+    fpr = sweep["fpr"][:, ::-1]
+    precision = np.nan_to_num(sweep["precision"][:, ::-1], nan=1.0)
+    roc_auc = np.trapz(recall, fpr, axis=1)
+    average_precision = (np.diff(recall, axis=1) * precision[:, 1:]).sum(axis=1)
+    best = np.argmax(sweep["f1"], axis=1)
+
+    summary = [
+        {
+            "roc_auc": float(roc_auc[v]),
+            "average_precision": float(average_precision[v]),
+            "best_f1": float(sweep["f1"][v, best[v]]),
+            "best_f1_threshold": float(sweep["thresholds"][best[v]]),
+        }
+        for v in range(len(best))
+    ]
+    if variants is None:
+        return summary
+    return dict(zip(variants, summary))